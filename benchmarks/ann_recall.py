@@ -0,0 +1,94 @@
+"""Recall vs. latency of IVFVectorStore against exact NumpyVectorStore search.
+
+Uses synthetic clustered embeddings (768 dimensions by default, matching
+Neo4jVectorStore), inserted in batches to exercise incremental inserts:
+    python -m benchmarks.ann_recall --vectors 100000 --nprobe 1 4 16 64
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from models import DocumentChunk
+from vector_store import NumpyVectorStore, IVFVectorStore
+
+
+def make_embeddings(num_vectors: int, centers: np.ndarray,
+                    rng: np.random.Generator) -> np.ndarray:
+    _labels = rng.integers(len(centers), size=num_vectors)
+    return centers[_labels] + 0.5 * rng.standard_normal(
+        (num_vectors, centers.shape[1])).astype(np.float32)
+
+
+def add_embeddings(stores, embeddings: np.ndarray, batch_size: int):
+    for _start in range(0, len(embeddings), batch_size):
+        _chunks = [DocumentChunk(
+            text=str(_start + _i),
+            document_name=f"document_{(_start + _i) // 1000}",
+            document_path="",
+            page="1",
+            embedding=_embedding
+        ) for _i, _embedding in enumerate(embeddings[_start:_start + batch_size])]
+        for _store in stores:
+            _store.add_batch_chunks(_chunks)
+
+
+def timed_search(store, queries: np.ndarray, k: int) -> tuple[list[set[str]], list[float]]:
+    _results, _latencies = [], []
+    for _query in queries:
+        _start = time.perf_counter()
+        _hits = store.retrieve(_query, k)
+        _latencies.append(time.perf_counter() - _start)
+        _results.append({_chunk.text for _chunk, _ in _hits})
+    return _results, _latencies
+
+
+def summarize(latencies: list[float]) -> dict:
+    _ms = np.asarray(latencies) * 1000
+    return {'mean_ms': float(_ms.mean()), 'p50_ms': float(np.percentile(_ms, 50)),
+            'p95_ms': float(np.percentile(_ms, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vectors', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=500)
+    parser.add_argument('--n-lists', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--similarity', choices=['cosine', 'euclidean'], default='cosine')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.embedding_size)).astype(np.float32)
+    embeddings = make_embeddings(args.vectors, centers, rng)
+    queries = make_embeddings(args.queries, centers, rng)
+
+    exact = NumpyVectorStore(embedding_size=args.embedding_size, similarity=args.similarity)
+    ivf = IVFVectorStore(embedding_size=args.embedding_size, similarity=args.similarity,
+                         n_lists=args.n_lists)
+    add_embeddings([exact, ivf], embeddings, args.batch_size)
+
+    truth, latencies = timed_search(exact, queries, args.k)
+    results = {'exact': summarize(latencies), 'ivf': {}}
+    print(f"exact: {results['exact']['mean_ms']:.2f} ms/query")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, latencies = timed_search(ivf, queries, args.k)
+        recall = float(np.mean([len(_f & _t) / len(_t) for _f, _t in zip(found, truth)]))
+        results['ivf'][nprobe] = {'recall': recall, **summarize(latencies)}
+        print(f"nprobe={nprobe}: recall@{args.k}={recall:.3f}, "
+              f"{results['ivf'][nprobe]['mean_ms']:.2f} ms/query")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
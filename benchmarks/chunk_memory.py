@@ -0,0 +1,65 @@
+"""Memory held by DocumentChunk embeddings as Python lists vs. a shared float32 block.
+
+    python -m benchmarks.chunk_memory --chunks 20000
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+
+from models import DocumentChunk
+
+
+def make_embeddings(num_chunks: int, embedding_size: int) -> list[list[float]]:
+    rng = random.Random(0)
+    return [[rng.uniform(-1, 1) for _ in range(embedding_size)] for _ in range(num_chunks)]
+
+
+def make_chunks(num_chunks: int) -> list[DocumentChunk]:
+    return [DocumentChunk(f"chunk {i}", "document.pdf", "docs/document.pdf", str(i), [])
+            for i in range(num_chunks)]
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    _result = build()
+    _size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del _result
+    return _size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=10000)
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    def _lists():
+        _chunks = make_chunks(args.chunks)
+        for _chunk, _embedding in zip(_chunks, make_embeddings(args.chunks, args.embedding_size)):
+            _chunk.embedding = _embedding
+        return _chunks
+
+    def _block():
+        _chunks = make_chunks(args.chunks)
+        DocumentChunk.attach_embeddings(_chunks, make_embeddings(args.chunks, args.embedding_size))
+        return _chunks
+
+    results = {'list_bytes': measure(_lists), 'block_bytes': measure(_block)}
+    results['ratio'] = results['list_bytes'] / results['block_bytes']
+    print(f"{args.chunks} chunks x {args.embedding_size} dims: "
+          f"lists {results['list_bytes'] / 2 ** 20:.1f} MiB, "
+          f"float32 block {results['block_bytes'] / 2 ** 20:.1f} MiB "
+          f"({results['ratio']:.1f}x smaller)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Deterministic, offline stand-ins for the Ollama/OpenAI models used by LLM and Embedding."""
+import asyncio
+import hashlib
+import time
+from typing import Any
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+DEFAULT_RESPONSE = ("Based on the provided context, the study reports a modest effect that "
+                    "depends on the patient group, so the answer is that it does not have "
+                    "information beyond what the documents state.")
+
+
+def hash_embedding(text: str, embedding_size: int) -> list[float]:
+    _seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    _vector = np.random.default_rng(_seed).standard_normal(embedding_size).astype(np.float32)
+    return (_vector / np.linalg.norm(_vector)).tolist()
+
+
+class FakeEmbedding(BaseEmbedding):
+    embed_dim: int = Field(default=768)
+    latency: float = Field(default=0.0, description="Simulated seconds per embedding call")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return 'FakeEmbedding'
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        time.sleep(self.latency)
+        return hash_embedding(query, self.embed_dim)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return hash_embedding(query, self.embed_dim)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return hash_embedding(text, self.embed_dim)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency)
+        return [hash_embedding(_text, self.embed_dim) for _text in texts]
+
+
+class FakeLLM(CustomLLM):
+    response: str = Field(default=DEFAULT_RESPONSE)
+    first_token_latency: float = Field(default=0.0, description="Simulated seconds before the first token")
+    token_latency: float = Field(default=0.0, description="Simulated seconds between streamed tokens")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return 'FakeLLM'
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name='fake')
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        _tokens = self._tokens()
+        time.sleep(self.first_token_latency + self.token_latency * (len(_tokens) - 1))
+        return CompletionResponse(text=self.response)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        _text = ''
+        time.sleep(self.first_token_latency)
+        for _i, _token in enumerate(self._tokens()):
+            if _i:
+                time.sleep(self.token_latency)
+            _text += _token
+            yield CompletionResponse(text=_text, delta=_token)
+
+    def _tokens(self) -> list[str]:
+        _words = self.response.split(' ')
+        return [_words[0]] + [' ' + _word for _word in _words[1:]]
@@ -0,0 +1,66 @@
+"""Per-chunk vs. bulk UNWIND ingestion into Neo4jVectorStore.
+
+Needs a local Neo4j, e.g.:
+    docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/neo4jneo4j neo4j:5.20
+    python -m benchmarks.neo4j_ingest --chunks 5000 --batch-sizes 100 500 1000
+
+The benchmark clears the target database between runs.
+"""
+import argparse
+import json
+import os
+import random
+
+from models import DocumentChunk
+from vector_store import Neo4jVectorStore
+
+
+def make_chunks(num_chunks: int, num_documents: int, embedding_size: int,
+                seed: int = 0) -> list[DocumentChunk]:
+    rng = random.Random(seed)
+    return [DocumentChunk(
+        text=f"Synthetic chunk {i} " + "lorem ipsum " * 80,
+        document_name=f"document_{i % num_documents}.pdf",
+        document_path=f"docs/document_{i % num_documents}.pdf",
+        page=str(i // num_documents + 1),
+        embedding=[rng.uniform(-1, 1) for _ in range(embedding_size)]
+    ) for i in range(num_chunks)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=os.environ.get('NEO4J_URI', 'bolt://localhost:7687'))
+    parser.add_argument('--user', default=os.environ.get('NEO4J_USER', 'neo4j'))
+    parser.add_argument('--password', default=os.environ.get('NEO4J_PASSWORD', 'neo4jneo4j'))
+    parser.add_argument('--chunks', type=int, default=2000)
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.documents, args.embedding_size)
+    store = Neo4jVectorStore(args.uri, args.user, args.password,
+                             embedding_size=args.embedding_size)
+    results = {}
+    try:
+        store.clear_data()
+        results['per_chunk'] = store.add_batch_chunks(chunks, bulk=False)
+        print(f"per-chunk: {results['per_chunk']:.1f} chunks/s")
+        for batch_size in args.batch_sizes:
+            store.clear_data()
+            store.write_batch_size = batch_size
+            results[f'bulk_{batch_size}'] = store.add_batch_chunks(chunks, bulk=True)
+            print(f"bulk (batch {batch_size}): {results[f'bulk_{batch_size}']:.1f} chunks/s "
+                  f"({results[f'bulk_{batch_size}'] / results['per_chunk']:.1f}x)")
+        store.clear_data()
+    finally:
+        store.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Latency and allocations of Neo4jVectorStore.retrieve with and without vectors.
+
+Needs a local Neo4j (see benchmarks/neo4j_ingest.py); the target database is cleared:
+    python -m benchmarks.neo4j_retrieval --chunks 5000 --k 5 20 100
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.neo4j_ingest import make_chunks
+from vector_store import Neo4jVectorStore
+
+
+def measure(store: Neo4jVectorStore, queries: list[list[float]], k: int,
+            include_embeddings: bool) -> dict:
+    _latencies = []
+    _peaks = []
+    for _query in queries:
+        tracemalloc.start()
+        _start = time.perf_counter()
+        store.retrieve(_query, k, include_embeddings=include_embeddings)
+        _latencies.append(time.perf_counter() - _start)
+        _peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        'mean_ms': statistics.mean(_latencies) * 1000,
+        'p95_ms': statistics.quantiles(_latencies, n=20)[-1] * 1000,
+        'peak_kib': statistics.mean(_peaks) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=os.environ.get('NEO4J_URI', 'bolt://localhost:7687'))
+    parser.add_argument('--user', default=os.environ.get('NEO4J_USER', 'neo4j'))
+    parser.add_argument('--password', default=os.environ.get('NEO4J_PASSWORD', 'neo4jneo4j'))
+    parser.add_argument('--chunks', type=int, default=5000)
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 20, 100])
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [[rng.uniform(-1, 1) for _ in range(args.embedding_size)] for _ in range(args.queries)]
+    store = Neo4jVectorStore(args.uri, args.user, args.password,
+                             embedding_size=args.embedding_size)
+    results = {}
+    try:
+        store.clear_data()
+        store.add_batch_chunks(make_chunks(args.chunks, args.documents, args.embedding_size))
+        store.retrieve(queries[0], max(args.k))
+        for k in args.k:
+            results[k] = {
+                'with_embeddings': measure(store, queries, k, include_embeddings=True),
+                'projected': measure(store, queries, k, include_embeddings=False),
+            }
+            _full, _lean = results[k]['with_embeddings'], results[k]['projected']
+            print(f"k={k}: {_full['mean_ms']:.2f} -> {_lean['mean_ms']:.2f} ms, "
+                  f"{_full['peak_kib']:.0f} -> {_lean['peak_kib']:.0f} KiB allocated")
+        store.clear_data()
+    finally:
+        store.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
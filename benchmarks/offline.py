@@ -0,0 +1,186 @@
+"""End-to-end benchmarks that run without Ollama, OpenAI or Neo4j.
+
+Uses the deterministic models from benchmarks/fakes.py and NumpyVectorStore to measure
+ingestion throughput per stage, retrieval latency at growing corpus sizes and the
+overhead RAG.generate adds on top of the LLM call:
+    python -m benchmarks.offline --docs med_qa/docs --sizes 1000 10000 100000 --output offline.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+import telemetry
+from benchmarks.fakes import FakeEmbedding, FakeLLM
+from llm import LLM, Embedding
+from models import DocumentChunk
+from rag import RAG
+from rag.manifest import list_files
+from rag.pipeline import StreamingIngestion
+from rag.retriever import Retriever
+from vector_store import NumpyVectorStore
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    _ms = np.asarray(latencies) * 1000
+    return {
+        'count': len(latencies),
+        'mean_ms': float(_ms.mean()),
+        'p50_ms': float(np.percentile(_ms, 50)),
+        'p95_ms': float(np.percentile(_ms, 95)),
+        'p99_ms': float(np.percentile(_ms, 99)),
+    }
+
+
+def make_store(num_chunks: int, embedding_size: int, num_documents: int = 100,
+               batch_size: int = 10000) -> NumpyVectorStore:
+    _rng = np.random.default_rng(0)
+    _store = NumpyVectorStore(embedding_size=embedding_size, initial_capacity=num_chunks)
+    for _start in range(0, num_chunks, batch_size):
+        _end = min(_start + batch_size, num_chunks)
+        _chunks = [DocumentChunk(f"chunk {_i}", f"document_{_i % num_documents}.pdf",
+                                 f"docs/document_{_i % num_documents}.pdf", str(_i % 50 + 1), [])
+                   for _i in range(_start, _end)]
+        DocumentChunk.attach_embeddings(
+            _chunks, _rng.standard_normal((_end - _start, embedding_size), dtype=np.float32))
+        _store.add_batch_chunks(_chunks)
+    return _store
+
+
+def bench_ingestion(files: list[Path], embedding: Embedding, embedding_size: int,
+                    chunk_size: int, chunk_overlap: int, num_workers: int | None) -> dict:
+    _hook = telemetry.HistogramHook()
+    telemetry.add_hook(_hook)
+    try:
+        _retriever = Retriever(NumpyVectorStore(embedding_size=embedding_size), embedding)
+        _start = time.perf_counter()
+        _retriever.load_data_sources(files, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                     num_workers=num_workers)
+        _serial_seconds = time.perf_counter() - _start
+    finally:
+        telemetry.remove_hook(_hook)
+    _chunks = len(_retriever.vector_store)
+    _serial = {'seconds': _serial_seconds, 'chunks': _chunks,
+               'chunks_per_second': _chunks / _serial_seconds, 'stages': {}}
+    for _name, _summary in _hook.summary().items():
+        _stage = _name.removeprefix('ingest.')
+        _seconds = _summary['mean'] * _summary['count']
+        _serial['stages'][_stage] = {'seconds': _seconds,
+                                     'chunks_per_second': _chunks / _seconds if _seconds > 0 else 0.0}
+
+    _ingestion = StreamingIngestion(NumpyVectorStore(embedding_size=embedding_size), embedding,
+                                    chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                    num_workers=num_workers)
+    _start = time.perf_counter()
+    _stats = _ingestion.run(files)
+    _streaming_seconds = time.perf_counter() - _start
+    _streaming = {'seconds': _streaming_seconds, 'chunks': _stats['store'].items,
+                  'chunks_per_second': _stats['store'].items / _streaming_seconds,
+                  'stages': {_name: {'seconds': _stage.seconds, 'chunks_per_second': _stage.throughput}
+                             for _name, _stage in _stats.items()}}
+    return {'files': len(files), 'serial': _serial, 'streaming': _streaming}
+
+
+def bench_retrieval(sizes: list[int], embedding: Embedding, embedding_size: int,
+                    queries: list[str], k: int) -> dict:
+    _query_embeddings = [embedding.get_query_embedding(_query) for _query in queries]
+    _results = {}
+    for _size in sizes:
+        _retriever = Retriever(make_store(_size, embedding_size), embedding)
+        _retriever.retrieve_by_embedding(_query_embeddings[0], k)
+        _latencies = []
+        for _query_embedding in _query_embeddings:
+            _start = time.perf_counter()
+            _retriever.retrieve_by_embedding(_query_embedding, k)
+            _latencies.append(time.perf_counter() - _start)
+        _results[_size] = latency_summary(_latencies)
+        print(f"retrieve k={k} over {_size} chunks: p50 {_results[_size]['p50_ms']:.2f} ms, "
+              f"p95 {_results[_size]['p95_ms']:.2f} ms")
+    return _results
+
+
+def bench_generate(embedding: Embedding, embedding_size: int, corpus_size: int,
+                   queries: list[str], k: int, token_latency: float) -> dict:
+    _llm = LLM(FakeLLM())
+    _rag = RAG(make_store(corpus_size, embedding_size), embedding, _llm, num_chunks=k)
+    _bare, _total = [], []
+    for _query in queries:
+        _start = time.perf_counter()
+        _llm.generate(_query, [])
+        _bare.append(time.perf_counter() - _start)
+        _start = time.perf_counter()
+        _rag.generate(_query, [])
+        _total.append(time.perf_counter() - _start)
+
+    _rag.llm = LLM(FakeLLM(first_token_latency=10 * token_latency, token_latency=token_latency))
+    _first_token, _stream_total = [], []
+    for _query in queries:
+        _start = time.perf_counter()
+        _stream, _ = _rag.generate_stream(_query, [])
+        next(_stream)
+        _first_token.append(time.perf_counter() - _start)
+        for _ in _stream:
+            pass
+        _stream_total.append(time.perf_counter() - _start)
+
+    _overhead = [_t - _b for _t, _b in zip(_total, _bare)]
+    print(f"RAG.generate overhead over the LLM call: p50 {statistics.median(_overhead) * 1000:.2f} ms")
+    return {
+        'corpus_size': corpus_size,
+        'llm_generate': latency_summary(_bare),
+        'rag_generate': latency_summary(_total),
+        'rag_overhead': latency_summary(_overhead),
+        'stream_time_to_first_token': latency_summary(_first_token),
+        'stream_total': latency_summary(_stream_total),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', nargs='+', default=['med_qa/docs'])
+    parser.add_argument('--qa', default='med_qa/qa.json')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--chunk-size', type=int, default=300)
+    parser.add_argument('--chunk-overlap', type=int, default=60)
+    parser.add_argument('--num-workers', type=int, default=None)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--token-latency', type=float, default=0.001)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    embedding = Embedding(FakeEmbedding(embed_dim=args.embedding_size))
+    embedding.show_progress = False
+    with open(args.qa) as f:
+        questions = json.load(f)['question']
+    queries = [questions[_i % len(questions)] + ('' if _i < len(questions) else f" ({_i})")
+               for _i in range(args.queries)]
+
+    files = list_files([Path(_path) for _path in args.docs])
+    results = {
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'numpy': np.__version__},
+        'parameters': vars(args),
+        'ingestion': bench_ingestion(files, embedding, args.embedding_size, args.chunk_size,
+                                     args.chunk_overlap, args.num_workers),
+        'retrieval': bench_retrieval(args.sizes, embedding, args.embedding_size, queries, args.k),
+        'generate': bench_generate(embedding, args.embedding_size, min(args.sizes), queries,
+                                   args.k, args.token_latency),
+    }
+    for _mode in ('serial', 'streaming'):
+        _run = results['ingestion'][_mode]
+        print(f"{_mode} ingestion: {_run['chunks']} chunks in {_run['seconds']:.2f}s "
+              f"({_run['chunks_per_second']:.1f} chunks/s)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
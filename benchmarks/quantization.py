@@ -0,0 +1,60 @@
+"""Recall@k, memory and latency of quantized NumpyVectorStore against the float32 baseline.
+
+Uses the same synthetic clustered embeddings as benchmarks/ann_recall.py:
+    python -m benchmarks.quantization --vectors 100000 --k 10 --rescore-factor 4
+"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.ann_recall import add_embeddings, make_embeddings, summarize, timed_search
+from vector_store import NumpyVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vectors', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--rescore-factor', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--similarity', choices=['cosine', 'euclidean'], default='cosine')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.clusters, args.embedding_size)).astype(np.float32)
+    embeddings = make_embeddings(args.vectors, centers, rng)
+    queries = make_embeddings(args.queries, centers, rng)
+
+    stores = {'float32': NumpyVectorStore(embedding_size=args.embedding_size, similarity=args.similarity)}
+    for quantization in ('float16', 'int8'):
+        stores[quantization] = NumpyVectorStore(
+            embedding_size=args.embedding_size, similarity=args.similarity,
+            quantization=quantization, rescore_factor=None)
+        stores[f"{quantization}+rescore"] = NumpyVectorStore(
+            embedding_size=args.embedding_size, similarity=args.similarity,
+            quantization=quantization, rescore_factor=args.rescore_factor)
+    add_embeddings(stores.values(), embeddings, args.batch_size)
+
+    truth, _ = timed_search(stores['float32'], queries, args.k)
+    results = {}
+    for name, store in stores.items():
+        found, latencies = timed_search(store, queries, args.k)
+        recall = float(np.mean([len(_f & _t) / len(_t) for _f, _t in zip(found, truth)]))
+        results[name] = {'recall': recall, **store.memory_usage(), **summarize(latencies)}
+        print(f"{name}: recall@{args.k}={recall:.3f}, "
+              f"search {results[name]['search_bytes'] / 2 ** 20:.1f} MiB, "
+              f"rescore {results[name]['rescore_bytes'] / 2 ** 20:.1f} MiB, "
+              f"{results[name]['mean_ms']:.2f} ms/query")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Cold-start and per-rerun cost of the GUI's RAG stack.
+
+Cold start is measured in fresh interpreters: importing the packages gui.py needs, with the
+model backends left lazy and with them imported eagerly as llm.base used to. A rerun is what
+Streamlit does on every chat message: building the stack each time versus a st.cache_resource hit.
+The store is a NumpyVectorStore unless --neo4j is given:
+    python -m benchmarks.startup --reruns 20 --neo4j --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import streamlit as st
+
+from benchmarks.offline import latency_summary
+from llm import LLM, Embedding
+from rag import RAG
+from vector_store import Neo4jVectorStore, NumpyVectorStore
+from vector_store import neo4j as neo4j_store
+
+
+_IMPORTS = {
+    'lazy': "import llm, rag, vector_store",
+    'eager': "import llm, rag, vector_store, llama_index.llms.ollama, llama_index.llms.openai, "
+             "llama_index.embeddings.ollama, llama_index.embeddings.openai",
+}
+
+
+def import_time(statement: str, repeats: int) -> dict:
+    _script = f"import time; _start = time.perf_counter(); {statement}; print(time.perf_counter() - _start)"
+    _seconds = [float(subprocess.run([sys.executable, '-c', _script], check=True, capture_output=True,
+                                     text=True).stdout) for _ in range(repeats)]
+    return {'median_s': statistics.median(_seconds), 'min_s': min(_seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--reruns', type=int, default=20)
+    parser.add_argument('--embedding', default='nomic-embed-text')
+    parser.add_argument('--llm', default='gpt-3.5-turbo')
+    parser.add_argument('--neo4j', action='store_true')
+    parser.add_argument('--uri', default=os.environ.get('NEO4J_URI', 'bolt://localhost:7687'))
+    parser.add_argument('--user', default=os.environ.get('NEO4J_USER', 'neo4j'))
+    parser.add_argument('--password', default=os.environ.get('NEO4J_PASSWORD', 'neo4jneo4j'))
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = {'cold_start': {}, 'rerun': {}}
+    for _name, _statement in _IMPORTS.items():
+        results['cold_start'][_name] = import_time(_statement, args.repeats)
+        print(f"import ({_name} backends): {results['cold_start'][_name]['median_s']:.3f} s")
+
+    def build_rag() -> RAG:
+        if args.neo4j:
+            _store = Neo4jVectorStore(args.uri, args.user, args.password, embedding_size=768)
+        else:
+            _store = NumpyVectorStore(embedding_size=768)
+        return RAG(_store, Embedding(args.embedding), LLM(args.llm))
+
+    def reset_driver_pool():
+        # Without the cache each rerun connected and ran the index DDL again; the process-wide
+        # driver pool and index memo would otherwise spare the uncached builds both
+        if not args.neo4j:
+            return
+        with neo4j_store._lock:
+            for _driver in neo4j_store._drivers.values():
+                _driver.close()
+            neo4j_store._drivers.clear()
+            neo4j_store._driver_references.clear()
+            neo4j_store._created_indexes.clear()
+
+    cached_rag = st.cache_resource(build_rag)
+    for _name, _build, _reset in (('uncached', build_rag, reset_driver_pool), ('cached', cached_rag, None)):
+        _latencies = []
+        for _ in range(args.reruns + 1):
+            if _reset is not None:
+                _reset()
+            _start = time.perf_counter()
+            _build()
+            _latencies.append(time.perf_counter() - _start)
+        # The first build also pays for importing the selected backends
+        results['rerun'][_name] = {'first_ms': _latencies[0] * 1000, **latency_summary(_latencies[1:])}
+        print(f"rerun ({_name}): first {results['rerun'][_name]['first_ms']:.2f} ms, "
+              f"p50 {results['rerun'][_name]['p50_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
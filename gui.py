@@ -12,15 +12,22 @@ from dotenv import load_dotenv
 
 load_dotenv(".env")
 
-rag = RAG(
-    Neo4jVectorStore(uri=os.environ.get("NEO4J_URI"),
-                     user=os.environ.get("NEO4J_USER"),
-                     password=os.environ.get("NEO4J_PASSWORD"),
-                     embedding_size=768),
-    Embedding('nomic-embed-text'),
-    LLM('gpt-3.5-turbo'),
-    language='serbian'
-)
+
+# Streamlit reruns this script on every message; the stack is built once and shared by all sessions
+@st.cache_resource
+def load_rag() -> RAG:
+    return RAG(
+        Neo4jVectorStore(uri=os.environ.get("NEO4J_URI"),
+                         user=os.environ.get("NEO4J_USER"),
+                         password=os.environ.get("NEO4J_PASSWORD"),
+                         embedding_size=768),
+        Embedding('nomic-embed-text'),
+        LLM('gpt-3.5-turbo'),
+        language='serbian'
+    )
+
+
+rag = load_rag()
 
 TITLES = {
     'serbian': 'QA Chatbot za klinička ispitivanja',
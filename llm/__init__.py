@@ -1,7 +1,11 @@
 from llm.base import LLM, Embedding
+from llm.embedding_cache import EmbeddingCache, CachedEmbedding
+from llm.embedding_executor import EmbeddingExecutor
 
 __all__ = [
     'LLM',
     'Embedding',
+    'EmbeddingCache',
+    'CachedEmbedding',
+    'EmbeddingExecutor',
 ]
-
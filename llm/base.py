@@ -1,14 +1,16 @@
 from abc import ABC, abstractmethod
+import asyncio
+import importlib
 import os
-from typing import Type, Generator
+import sys
+from typing import Type, Generator, AsyncGenerator
 
 import llama_index.core.llms as li_llm
 import llama_index.core.embeddings as li_emb
 from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.ollama import Ollama
-from llama_index.llms.openai import OpenAI
+
+import telemetry
+from llm.embedding_executor import EmbeddingExecutor
 # from llama_index.llms.huggingface import HuggingFaceLLM
 
 
@@ -24,9 +26,11 @@ SYSTEM_PROMPT_TEMPLATE = """
 If you don't know the answer, just say that you don't know, don't try to make up an answer."""
 
 
-LLMS: dict[str, tuple[Type[li_llm.LLM], dict]] = {
-    'phi3': (Ollama, {'model': 'phi3', 'request_timeout': 300}),
-    'gpt-3.5-turbo': (OpenAI, {'api_key': os.environ.get('OPENAI_API_KEY'), 'model': 'gpt-3.5-turbo'}),
+# Backends are named as 'module:Class' and only imported once a model using them is created
+LLMS: dict[str, tuple[str, dict]] = {
+    'phi3': ('llama_index.llms.ollama:Ollama', {'model': 'phi3', 'request_timeout': 300}),
+    'gpt-3.5-turbo': ('llama_index.llms.openai:OpenAI',
+                      {'api_key': os.environ.get('OPENAI_API_KEY'), 'model': 'gpt-3.5-turbo'}),
     # 'hf-llama3': (HuggingFaceLLM, {'model_name': 'meta-llama/Meta-Llama-3-8B-Instruct',
     #                                'model_kwargs': {'token': os.environ.get('HF_TOKEN')}})
 }
@@ -34,11 +38,30 @@ LLMS: dict[str, tuple[Type[li_llm.LLM], dict]] = {
 LANGUAGE_PROMPT = "The context is given in english, but the question is in {lang}. You should answer in {lang}."
 DEFAULT_LANGUAGE = 'english'
 
-EMBEDDING_MODELS: dict[str, tuple[Type[li_emb.BaseEmbedding], dict]] = {
-    'nomic-embed-text': (OllamaEmbedding, {'model_name': 'nomic-embed-text'}),
-    'phi3': (OllamaEmbedding, {'model_name': 'phi3'}),
+EMBEDDING_MODELS: dict[str, tuple[str, dict]] = {
+    'nomic-embed-text': ('llama_index.embeddings.ollama:OllamaEmbedding', {'model_name': 'nomic-embed-text'}),
+    'phi3': ('llama_index.embeddings.ollama:OllamaEmbedding', {'model_name': 'phi3'}),
 }
 
+_SYMMETRIC_EMBEDDINGS = ('llama_index.embeddings.ollama:OllamaEmbedding',
+                         'llama_index.embeddings.openai:OpenAIEmbedding')
+# Backends whose async methods call the blocking client underneath
+_BLOCKING_ASYNC_EMBEDDINGS = ('llama_index.embeddings.ollama:OllamaEmbedding',)
+
+
+def _load_class(path: str) -> Type:
+    _module, _name = path.split(':')
+    return getattr(importlib.import_module(_module), _name)
+
+
+def _is_instance(obj, paths: tuple[str, ...]) -> bool:
+    # A backend that was never imported cannot have produced obj, so this never triggers an import
+    for _path in paths:
+        _module, _name = _path.split(':')
+        if _module in sys.modules and isinstance(obj, getattr(sys.modules[_module], _name)):
+            return True
+    return False
+
 
 class LLM:
     def __init__(self, model: li_llm.LLM | str,
@@ -46,27 +69,56 @@ class LLM:
                  context_prompt: str | None = CONTEXT_PROMPT_TEMPLATE):
         if isinstance(model, str):
             model_class, model_kwargs = LLMS[model]
-            self.model = model_class(**model_kwargs)
+            self.model = _load_class(model_class)(**model_kwargs)
         else:
             self.model = model
         self.system_prompt = system_prompt
         self.context_prompt = context_prompt
         self.language = DEFAULT_LANGUAGE
 
+    @property
+    def model_name(self) -> str:
+        return getattr(self.model, 'model', None) or type(self.model).__name__
+
     def generate(self, prompt: str,
                  history: list[tuple[li_llm.MessageRole, str]],
                  context: str | list[str] | None = None) -> str:
         _chat = self._prepare_chat(context, history, prompt)
-        return self.model.chat(_chat).message.content
+        with telemetry.span('llm.generate', model=self.model_name):
+            return self.model.chat(_chat).message.content
 
     def generate_stream(self, prompt: str,
                         history: list[tuple[li_llm.MessageRole, str]],
                         context: str | list[str] | None = None) -> Generator:
         _chat = self._prepare_chat(context, history, prompt)
         _prev_length = 0
-        for chunk in self.model.stream_chat(_chat):
-            yield chunk.message.content[_prev_length:]
-            _prev_length = len(chunk.message.content)
+        with telemetry.span('llm.generate_stream', model=self.model_name):
+            _timer = telemetry.stream_timer('llm', model=self.model_name)
+            for chunk in self.model.stream_chat(_chat):
+                _timer.tick()
+                yield chunk.message.content[_prev_length:]
+                _prev_length = len(chunk.message.content)
+            _timer.finish()
+
+    async def agenerate(self, prompt: str,
+                        history: list[tuple[li_llm.MessageRole, str]],
+                        context: str | list[str] | None = None) -> str:
+        _chat = self._prepare_chat(context, history, prompt)
+        with telemetry.span('llm.generate', model=self.model_name):
+            return (await self.model.achat(_chat)).message.content
+
+    async def agenerate_stream(self, prompt: str,
+                               history: list[tuple[li_llm.MessageRole, str]],
+                               context: str | list[str] | None = None) -> AsyncGenerator:
+        _chat = self._prepare_chat(context, history, prompt)
+        _prev_length = 0
+        with telemetry.span('llm.generate_stream', model=self.model_name):
+            _timer = telemetry.stream_timer('llm', model=self.model_name)
+            async for chunk in await self.model.astream_chat(_chat):
+                _timer.tick()
+                yield chunk.message.content[_prev_length:]
+                _prev_length = len(chunk.message.content)
+            _timer.finish()
 
     def _prepare_chat(self, context: str | list[str],
                       history: list[tuple[li_llm.MessageRole, str]],
@@ -90,17 +142,39 @@ class LLM:
 
 
 class Embedding:
-    def __init__(self, model: li_emb.BaseEmbedding | str):
+    def __init__(self, model: li_emb.BaseEmbedding | str,
+                 executor: EmbeddingExecutor | None = None):
         if isinstance(model, str):
             model_class, model_kwargs = EMBEDDING_MODELS[model]
-            self.model = model_class(**model_kwargs)
+            self.model = _load_class(model_class)(**model_kwargs)
         else:
             self.model = model
+        self.executor = executor
         self.show_progress = True
 
     def get_query_embedding(self, query: str) -> list[float]:
         return self.model.get_query_embedding(query)
 
+    def get_query_embedding_batch(self, queries: list[str]) -> list[list[float]]:
+        # llama-index has no batched query call; these backends embed queries and texts the same way
+        if _is_instance(self.model, _SYMMETRIC_EMBEDDINGS):
+            return self.model.get_text_embedding_batch(queries, show_progress=False)
+        return [self.model.get_query_embedding(_query) for _query in queries]
+
     def get_text_embedding_batch(self, text_list: list[str]) -> list[list[float]]:
+        if self.executor is not None:
+            return self.executor.embed(self.model, text_list)
         return self.model.get_text_embedding_batch(
             text_list, show_progress=self.show_progress)
+
+    async def aget_query_embedding(self, query: str) -> list[float]:
+        if _is_instance(self.model, _BLOCKING_ASYNC_EMBEDDINGS):
+            return await asyncio.to_thread(self.model.get_query_embedding, query)
+        return await self.model.aget_query_embedding(query)
+
+    async def aget_text_embedding_batch(self, text_list: list[str]) -> list[list[float]]:
+        if _is_instance(self.model, _BLOCKING_ASYNC_EMBEDDINGS):
+            return await asyncio.to_thread(self.model.get_text_embedding_batch,
+                                           text_list, show_progress=self.show_progress)
+        return await self.model.aget_text_embedding_batch(
+            text_list, show_progress=self.show_progress)
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Literal
+
+import llama_index.core.embeddings as li_emb
+
+from llm.base import Embedding
+from llm.embedding_executor import EmbeddingExecutor
+
+
+EmbeddingKind = Literal['query', 'text']
+
+
+class EmbeddingCache:
+    def __init__(self, path: str | Path = 'embedding_cache.sqlite',
+                 memory_entries: int = 10000,
+                 max_entries: int | None = 1000000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[tuple[str, str, str], list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, kind TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, kind, text_hash))")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._size = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        _total = self.hits + self.misses
+        return self.hits / _total if _total > 0 else 0.0
+
+    def get_many(self, model: str, kind: EmbeddingKind,
+                 texts: list[str]) -> list[list[float] | None]:
+        _keys = [(model, kind, self._hash(_text)) for _text in texts]
+        _results: list[list[float] | None] = [None] * len(texts)
+        _disk_lookups: dict[tuple[str, str, str], list[int]] = {}
+        with self._lock:
+            for _i, _key in enumerate(_keys):
+                if _key in self._memory:
+                    self._memory.move_to_end(_key)
+                    _results[_i] = self._memory[_key]
+                else:
+                    _disk_lookups.setdefault(_key, []).append(_i)
+            if _disk_lookups:
+                _now = time.time()
+                for _key, _indices in _disk_lookups.items():
+                    _row = self._connection.execute(
+                        "SELECT embedding FROM embeddings "
+                        "WHERE model = ? AND kind = ? AND text_hash = ?", _key).fetchone()
+                    if _row is None:
+                        continue
+                    _embedding = array('f', _row[0]).tolist()
+                    self._remember(_key, _embedding)
+                    for _i in _indices:
+                        _results[_i] = _embedding
+                    self._connection.execute(
+                        "UPDATE embeddings SET last_used = ? "
+                        "WHERE model = ? AND kind = ? AND text_hash = ?", (_now, *_key))
+                self._connection.commit()
+            _hits = sum(_result is not None for _result in _results)
+            self.hits += _hits
+            self.misses += len(texts) - _hits
+        return _results
+
+    def put_many(self, model: str, kind: EmbeddingKind,
+                 texts: list[str], embeddings: list[list[float]]):
+        _now = time.time()
+        _rows = []
+        with self._lock:
+            for _text, _embedding in zip(texts, embeddings):
+                _key = (model, kind, self._hash(_text))
+                self._remember(_key, _embedding)
+                _rows.append((*_key, array('f', _embedding).tobytes(), _now))
+            _before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, kind, text_hash, embedding, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", _rows)
+            self._size += self._connection.total_changes - _before
+            self._evict()
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._connection.execute("DELETE FROM embeddings")
+            self._connection.commit()
+            self._size = 0
+
+    def close(self):
+        self._connection.close()
+
+    def _remember(self, key: tuple[str, str, str], embedding: list[float]):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        if self.max_entries is None or self._size <= self.max_entries:
+            return
+        _excess = self._size - self.max_entries
+        self._connection.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)", (_excess,))
+        self._size -= _excess
+        logging.info(f"Evicted {_excess} embeddings from cache {self.path}")
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CachedEmbedding(Embedding):
+    def __init__(self, model: li_emb.BaseEmbedding | str,
+                 cache: EmbeddingCache | str | Path = 'embedding_cache.sqlite',
+                 executor: EmbeddingExecutor | None = None):
+        super().__init__(model, executor)
+        self.cache = cache if isinstance(cache, EmbeddingCache) else EmbeddingCache(cache)
+        self.model_name = getattr(self.model, 'model_name', None) or type(self.model).__name__
+
+    def get_query_embedding(self, query: str) -> list[float]:
+        _cached = self.cache.get_many(self.model_name, 'query', [query])[0]
+        if _cached is not None:
+            return _cached
+        _embedding = super().get_query_embedding(query)
+        self.cache.put_many(self.model_name, 'query', [query], [_embedding])
+        return _embedding
+
+    def get_query_embedding_batch(self, queries: list[str]) -> list[list[float]]:
+        _embeddings, _misses = self._lookup_texts(queries, 'query')
+        if not _misses:
+            return _embeddings
+        return self._merge_texts(queries, _embeddings, _misses,
+                                 super().get_query_embedding_batch(_misses), 'query')
+
+    def get_text_embedding_batch(self, text_list: list[str]) -> list[list[float]]:
+        _embeddings, _misses = self._lookup_texts(text_list)
+        if not _misses:
+            return _embeddings
+        return self._merge_texts(text_list, _embeddings, _misses,
+                                 super().get_text_embedding_batch(_misses))
+
+    # SQLite lookups and writes run in a worker thread so they never block the event loop
+    async def aget_query_embedding(self, query: str) -> list[float]:
+        _cached = (await asyncio.to_thread(self.cache.get_many, self.model_name, 'query', [query]))[0]
+        if _cached is not None:
+            return _cached
+        _embedding = await super().aget_query_embedding(query)
+        await asyncio.to_thread(self.cache.put_many, self.model_name, 'query', [query], [_embedding])
+        return _embedding
+
+    async def aget_text_embedding_batch(self, text_list: list[str]) -> list[list[float]]:
+        _embeddings, _misses = await asyncio.to_thread(self._lookup_texts, text_list)
+        if not _misses:
+            return _embeddings
+        return await asyncio.to_thread(self._merge_texts, text_list, _embeddings, _misses,
+                                       await super().aget_text_embedding_batch(_misses))
+
+    def _lookup_texts(self, text_list: list[str],
+                      kind: str = 'text') -> tuple[list[list[float] | None], list[str]]:
+        _embeddings = self.cache.get_many(self.model_name, kind, text_list)
+        _misses = list(dict.fromkeys(
+            _text for _text, _embedding in zip(text_list, _embeddings) if _embedding is None))
+        logging.info(f"Embedding cache: {len(text_list) - _embeddings.count(None)}/{len(text_list)} "
+                     f"{kind} embeddings cached, hit rate {self.cache.hit_rate:.1%}")
+        return _embeddings, _misses
+
+    def _merge_texts(self, text_list: list[str],
+                     embeddings: list[list[float] | None],
+                     misses: list[str],
+                     computed: list[list[float]],
+                     kind: str = 'text') -> list[list[float]]:
+        self.cache.put_many(self.model_name, kind, misses, computed)
+        _computed = dict(zip(misses, computed))
+        return [_computed[_text] if _embedding is None else _embedding
+                for _text, _embedding in zip(text_list, embeddings)]
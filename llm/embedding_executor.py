@@ -0,0 +1,88 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import llama_index.core.embeddings as li_emb
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    _status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if _status == 429:
+        return True
+    _message = f"{type(error).__name__} {error}".lower()
+    return 'ratelimit' in _message or 'rate limit' in _message or '429' in _message
+
+
+class EmbeddingExecutor:
+    def __init__(self, max_workers: int = 4,
+                 batch_size: int = 32,
+                 min_batch_size: int = 1,
+                 max_batch_size: int = 512,
+                 target_latency: float = 2.0,
+                 max_retries: int = 5,
+                 backoff: float = 1.0):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.embedded = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings_per_second(self) -> float:
+        return self.embedded / self.seconds if self.seconds > 0 else 0.0
+
+    def embed(self, model: li_emb.BaseEmbedding, texts: list[str]) -> list[list[float]]:
+        _start = time.perf_counter()
+        _results: list[list[float]] = [[] for _ in texts]
+        _pending: dict[Future, int] = {}
+        _position = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as _executor:
+            while _position < len(texts) or _pending:
+                # Each new batch picks up the batch size tuned from the batches finished so far
+                while _position < len(texts) and len(_pending) < self.max_workers:
+                    _batch = texts[_position:_position + self.batch_size]
+                    _pending[_executor.submit(self._embed_batch, model, _batch)] = _position
+                    _position += len(_batch)
+                _done, _ = wait(_pending, return_when=FIRST_COMPLETED)
+                for _future in _done:
+                    _offset = _pending.pop(_future)
+                    _embeddings, _latency = _future.result()
+                    _results[_offset:_offset + len(_embeddings)] = _embeddings
+                    self._tune(len(_embeddings), _latency)
+
+        _elapsed = time.perf_counter() - _start
+        with self._lock:
+            self.embedded += len(texts)
+            self.seconds += _elapsed
+        _rate = len(texts) / _elapsed if _elapsed > 0 else 0.0
+        logging.info(f"Embedded {len(texts)} texts in {_elapsed:.2f}s ({_rate:.1f} embeddings/s, "
+                     f"{self.max_workers} workers, batch size {self.batch_size})")
+        return _results
+
+    def _embed_batch(self, model: li_emb.BaseEmbedding,
+                     texts: list[str]) -> tuple[list[list[float]], float]:
+        for _attempt in range(self.max_retries + 1):
+            _start = time.perf_counter()
+            try:
+                _embeddings = model.get_text_embedding_batch(texts, show_progress=False)
+                return _embeddings, time.perf_counter() - _start
+            except Exception as e:
+                if _attempt == self.max_retries or not _is_rate_limited(e):
+                    raise
+                _delay = self.backoff * 2 ** _attempt * (1 + random.random())
+                logging.warning(f"Rate limited embedding {len(texts)} texts, retrying in {_delay:.1f}s")
+                time.sleep(_delay)
+
+    def _tune(self, size: int, latency: float):
+        with self._lock:
+            if latency > self.target_latency:
+                self.batch_size = max(self.min_batch_size, min(self.batch_size, size) // 2)
+            elif latency < self.target_latency / 2 and size >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
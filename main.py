@@ -1,80 +1,218 @@
+import argparse
+import json
 import os
-from time import sleep
-
-from rag import RAG
-from llm import LLM, Embedding
-from vector_store import Neo4jVectorStore
+import re
+import subprocess
+import sys
+from pathlib import Path
 
 from dotenv import load_dotenv
-from rag.utils import (
-    run_on_dataset,
-    run_query,
-    load_data_sources,
-    evaluate_rag,
-    run_gui
-)
-
-
-run_gui()
-
-load_dotenv(".env")
-#
-# rag = RAG(
-#     Neo4jVectorStore(uri="bolt://localhost:7687", user="neo4j", password="neo4jneo4j",
-#                      embedding_size=768),
-#     Embedding('nomic-embed-text'),
-#     LLM('phi3'),
-#     num_chunks=3
-# )
-
-
-# load_data_sources(rag, r'med_qa/docs',True,300,40)
-# load_data_sources(r'med_qa/docs')
-# run_query("What are the major factors contributing to the change in Apple's "
-#           "gross margin in the most recent 10-Q compared to the previous quarters?")
-# run_on_dataset(rag, r'med_qa/qa.json', r'med_qa/output2.json',
-#                metadata={
-#                     'dataset': 'med_qa',
-#                     'vector_store': 'neo4j',
-#                     'RAG': True,
-#                     'chunk_size': 300,
-#                     'chunk_overlap': 40,
-#                     'embedding': 'nomic-embed-text',
-#                     'llm': 'phi3'})
-# evaluate_rag(r'med_qa/output2.json', r'med_qa/results2_1.json',True,7,0)
-# sleep(10)
-# evaluate_rag(r'med_qa/output2.json', r'med_qa/results2_2.json',True,14,7)
-# sleep(10)
-# evaluate_rag(r'med_qa/output2.json', r'med_qa/results2_3.json',True,22,14)
-
-# run_testset_generation(r'C:\Users\matij\Projects\opc-rag\pdf',
-#                        r'C:\Users\matij\Projects\opc-rag\testset.csv', 10)
-
-# prompt = "What are the major factors contributing to the change in Apple's " \
-#          "gross margin in the most recent 10-Q compared to the previous quarters?"
-# response, context = rag.generate(prompt, [])
-# print(response)
-# # for r in response:
-# #     print(r)
-# for chunk in context:
-#     print("##############################################################################################")
-#     print(chunk.document_name)
-#     print(chunk.text)
-
-# qa = pd.read_csv(r'data/KG-RAG-datasets/sec-10-q/data/v1/qna_data_aapl.csv')
-# for i, row in qa.iterrows():
-#     prompt = row['Question']
-#     response, context = rag.generate(prompt, [])
-#     print('Question:')
-#     print(prompt, end='\n\n')
-#
-#     print('Answer:')
-#     print(response, end='\n\n')
-#
-#     print('Ground Truth:')
-#     print(row['Answer'], end='\n\n')
-#     print("##############################################################################################")
-# for chunk in context:
-#     print(chunk.document_name)
-#     print(chunk.text)
-#     print("##############################################################################################")
+
+
+# Modules each subcommand imports, kept in step with the imports inside the handlers below
+COMMAND_IMPORTS = {
+    'ingest': ('rag', 'llm', 'vector_store', 'rag.parse_cache'),
+    'query': ('rag', 'llm', 'vector_store', 'rag.utils'),
+    'run-dataset': ('rag', 'llm', 'vector_store', 'rag.utils'),
+    'evaluate': ('rag.utils', 'rag.evaluation'),
+    'gui': (),
+}
+# What every invocation paid before the CLI, when main.py imported all of the above at module level
+EAGER_IMPORTS = ('rag', 'llm', 'vector_store', 'datasets', 'ragas', 'ragas.metrics', 'pandas')
+
+_IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def build_rag(args: argparse.Namespace, with_llm: bool = True):
+    from rag import RAG
+    from llm import LLM, Embedding
+    from vector_store import Neo4jVectorStore, NumpyVectorStore
+
+    if args.vector_store == 'neo4j':
+        _store = Neo4jVectorStore(args.neo4j_uri, args.neo4j_user, args.neo4j_password,
+                                  embedding_size=args.embedding_size)
+    else:
+        _store = NumpyVectorStore(args.store_path, embedding_size=args.embedding_size)
+    return RAG(_store, Embedding(args.embedding),
+               LLM(args.llm) if with_llm else None,
+               num_chunks=args.num_chunks,
+               language=args.language)
+
+
+def ingest(args: argparse.Namespace):
+    from rag.parse_cache import ParseCache
+
+    _rag = build_rag(args, with_llm=False)
+    _options = {
+        'overlap_pages': args.overlap_pages,
+        'chunk_size': args.chunk_size,
+        'chunk_overlap': args.chunk_overlap,
+        'streaming': args.streaming,
+        'num_workers': args.num_workers,
+        'parse_cache': ParseCache(args.parse_cache) if args.parse_cache else None,
+    }
+    _paths = [Path(_path) for _path in args.paths]
+    if args.manifest:
+        _changes = _rag.sync_data_sources(_paths, args.manifest, **_options)
+        print(", ".join(f"{len(_files)} {_change}" for _change, _files in _changes.items()))
+    else:
+        _rag.load_data_sources(_paths, reset_data_sources=args.reset, **_options)
+
+
+def query(args: argparse.Namespace):
+    from rag.utils import run_query
+
+    run_query(build_rag(args), args.question)
+
+
+def run_dataset(args: argparse.Namespace):
+    from rag.utils import run_on_dataset
+
+    run_on_dataset(build_rag(args), args.qa, args.output,
+                   metadata=json.loads(args.metadata) if args.metadata else None,
+                   concurrency=args.concurrency,
+                   timeout=args.timeout)
+
+
+def evaluate(args: argparse.Namespace):
+    from rag.utils import evaluate_rag, evaluate_rag_sharded
+
+    if args.shard_size is None:
+        _truncate = args.trunc_from is not None or args.trunc_to is not None
+        evaluate_rag(args.rag_output, args.results, _truncate,
+                     args.trunc_to, args.trunc_from or 0)
+        return
+    _scores = evaluate_rag_sharded(args.rag_output, args.results,
+                                   shard_size=args.shard_size,
+                                   concurrency=args.concurrency,
+                                   requests_per_minute=args.rpm,
+                                   tokens_per_minute=args.tpm)
+    for _name, _score in _scores.items():
+        print(f"{_name}: {_score:.3f}")
+
+
+def gui(args: argparse.Namespace):
+    # Streamlit imports the RAG stack itself, in its own process
+    _gui = Path(__file__).resolve().parent / 'gui.py'
+    sys.exit(subprocess.run([sys.executable, '-m', 'streamlit', 'run', str(_gui), *args.streamlit_args]).returncode)
+
+
+def profile_imports(modules: tuple[str, ...], top: int) -> dict:
+    # Each profile runs in a fresh interpreter so modules imported by earlier ones are not free
+    _statement = f"import {', '.join(modules)}" if modules else "pass"
+    _process = subprocess.run([sys.executable, '-X', 'importtime', '-c', _statement],
+                              capture_output=True, text=True, cwd=Path(__file__).resolve().parent)
+    _lines = _process.stderr.splitlines()
+    if _process.returncode != 0:
+        return {'error': _lines[-1] if _lines else f"exit code {_process.returncode}"}
+    _imports = [(_match.group(4), len(_match.group(3)), int(_match.group(2)))
+                for _match in map(_IMPORT_TIME.match, _lines) if _match]
+    # Top-level imports are the least indented entries; interpreter startup (site, encodings) is left out
+    _packages = {_module.split('.')[0] for _module in modules}
+    _top_level = sorted(((_name, _us) for _name, _indent, _us in _imports
+                         if _indent == 1 and _name.split('.')[0] in _packages),
+                        key=lambda _item: _item[1], reverse=True)
+    return {
+        'total_ms': sum(_us for _, _us in _top_level) / 1000,
+        'slowest': {_name: _us / 1000 for _name, _us in _top_level[:top]},
+    }
+
+
+def import_profile(args: argparse.Namespace):
+    _targets = {_command: COMMAND_IMPORTS[_command] for _command in args.commands}
+    _targets['eager (before the CLI)'] = EAGER_IMPORTS
+    _report = {}
+    for _name, _modules in _targets.items():
+        _report[_name] = _profile = profile_imports(_modules, args.top)
+        if 'error' in _profile:
+            print(f"{_name}: {_profile['error']}")
+            continue
+        print(f"{_name}: {_profile['total_ms']:.0f} ms")
+        for _module, _ms in _profile['slowest'].items():
+            print(f"    {_module}: {_ms:.0f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(_report, f, indent=4)
+
+
+def _add_rag_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--vector-store', choices=['neo4j', 'numpy'], default='neo4j')
+    parser.add_argument('--neo4j-uri', default=os.environ.get('NEO4J_URI', 'bolt://localhost:7687'))
+    parser.add_argument('--neo4j-user', default=os.environ.get('NEO4J_USER', 'neo4j'))
+    parser.add_argument('--neo4j-password', default=os.environ.get('NEO4J_PASSWORD'))
+    parser.add_argument('--store-path', default=None, help="directory of the numpy vector store")
+    parser.add_argument('--embedding-size', type=int, default=768)
+    parser.add_argument('--embedding', default='nomic-embed-text')
+    parser.add_argument('--llm', default='phi3')
+    parser.add_argument('--num-chunks', type=int, default=3)
+    parser.add_argument('--language', default='english')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Retrieval augmented QA over medical trial documents")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    _ingest = subparsers.add_parser('ingest', help="load documents into the vector store")
+    _add_rag_arguments(_ingest)
+    _ingest.add_argument('paths', nargs='+')
+    _ingest.add_argument('--chunk-size', type=int, default=300)
+    _ingest.add_argument('--chunk-overlap', type=int, default=60)
+    _ingest.add_argument('--overlap-pages', action='store_true')
+    _ingest.add_argument('--reset', action='store_true', help="clear the store before loading")
+    _ingest.add_argument('--manifest', default=None, help="only re-ingest files changed since this manifest")
+    _ingest.add_argument('--streaming', action='store_true')
+    _ingest.add_argument('--num-workers', type=int, default=None)
+    _ingest.add_argument('--parse-cache', default=None, help="directory for cached parsed pages")
+    _ingest.set_defaults(handler=ingest)
+
+    _query = subparsers.add_parser('query', help="answer a single question")
+    _add_rag_arguments(_query)
+    _query.add_argument('question')
+    _query.set_defaults(handler=query)
+
+    _run_dataset = subparsers.add_parser('run-dataset', help="answer every question of a QA dataset")
+    _add_rag_arguments(_run_dataset)
+    _run_dataset.add_argument('qa', help="QA json with question and answer lists; the answers are scored as ground_truth")
+    _run_dataset.add_argument('output', help="output json, with a .jsonl checkpoint next to it")
+    _run_dataset.add_argument('--metadata', default=None, help="json object stored with the output")
+    _run_dataset.add_argument('--concurrency', type=int, default=4)
+    _run_dataset.add_argument('--timeout', type=float, default=None)
+    _run_dataset.set_defaults(handler=run_dataset)
+
+    _evaluate = subparsers.add_parser('evaluate', help="score run-dataset output with ragas")
+    _evaluate.add_argument('rag_output')
+    _evaluate.add_argument('results')
+    _evaluate.add_argument('--trunc-from', type=int, default=None)
+    _evaluate.add_argument('--trunc-to', type=int, default=None)
+    _evaluate.add_argument('--shard-size', type=int, default=None,
+                           help="evaluate in checkpointed shards of this many samples, resuming finished ones")
+    _evaluate.add_argument('--concurrency', type=int, default=2, help="shards evaluated at once")
+    _evaluate.add_argument('--rpm', type=float, default=None, help="LLM requests per minute limit")
+    _evaluate.add_argument('--tpm', type=float, default=None, help="LLM tokens per minute limit")
+    _evaluate.set_defaults(handler=evaluate)
+
+    _gui = subparsers.add_parser('gui', help="start the streamlit chat interface, "
+                                             "passing any further arguments to streamlit run")
+    _gui.set_defaults(handler=gui)
+
+    _import_profile = subparsers.add_parser('import-profile', help="report import time of each subcommand")
+    _import_profile.add_argument('--commands', nargs='+', choices=list(COMMAND_IMPORTS),
+                                 default=list(COMMAND_IMPORTS))
+    _import_profile.add_argument('--top', type=int, default=5)
+    _import_profile.add_argument('--output', default=None)
+    _import_profile.set_defaults(handler=import_profile)
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv(".env")
+    parser = build_parser()
+    args, _extra = parser.parse_known_args(argv)
+    if _extra and args.handler is not gui:
+        parser.error(f"unrecognized arguments: {' '.join(_extra)}")
+    args.streamlit_args = _extra
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
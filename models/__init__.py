@@ -1,6 +1,8 @@
 from models.document_chunk import DocumentChunk
+from models.retrieval_filter import RetrievalFilter
 
 
 __all__ = [
-    'DocumentChunk'
+    'DocumentChunk',
+    'RetrievalFilter'
 ]
\ No newline at end of file
@@ -1,14 +1,18 @@
+from typing import Sequence
+
+import numpy as np
 from llama_index.core.schema import BaseNode
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentChunk:
     text: str
     document_name: str
     document_path: str
     page: str
-    embedding: list[float]
+    # A list, or a row view into a float32/float16 block shared by a whole batch (see attach_embeddings)
+    embedding: Sequence[float]
 
     @classmethod
     def from_llama_index_node(cls, node: BaseNode):
@@ -18,3 +22,17 @@ class DocumentChunk:
             node.metadata["file_path"],
             node.metadata["page_label"],
             [])
+
+    @staticmethod
+    def attach_embeddings(chunks: list['DocumentChunk'],
+                          embeddings: Sequence[Sequence[float]],
+                          dtype: type | np.dtype = np.float32) -> np.ndarray:
+        _block = np.asarray(embeddings, dtype=dtype)
+        for _chunk, _row in zip(chunks, _block):
+            _chunk.embedding = _row
+        return _block
+
+    def embedding_list(self) -> list[float]:
+        if isinstance(self.embedding, np.ndarray):
+            return self.embedding.tolist()
+        return list(self.embedding)
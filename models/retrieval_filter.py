@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+
+@dataclass(frozen=True)
+class RetrievalFilter:
+    document_names: tuple[str, ...] | None = None
+    path_prefix: str | None = None
+    min_page: int | None = None
+    max_page: int | None = None
+    ingested_after: datetime | None = None
+    ingested_before: datetime | None = None
+
+    def __post_init__(self):
+        if self.document_names is not None and not isinstance(self.document_names, tuple):
+            object.__setattr__(self, 'document_names', tuple(self.document_names))
+        for _name in ('ingested_after', 'ingested_before'):
+            _date = getattr(self, _name)
+            if _date is not None and _date.tzinfo is None:
+                object.__setattr__(self, _name, _date.replace(tzinfo=timezone.utc))
+
+    @property
+    def has_page_range(self) -> bool:
+        return self.min_page is not None or self.max_page is not None
+
+    def matches_document(self, name: str, path: str, date: datetime | str | None) -> bool:
+        if self.document_names is not None and name not in self.document_names:
+            return False
+        if self.path_prefix is not None and not (path or '').startswith(self.path_prefix):
+            return False
+        if self.ingested_after is None and self.ingested_before is None:
+            return True
+        if date is None:
+            return False
+        if isinstance(date, str):
+            date = datetime.fromisoformat(date)
+        if self.ingested_after is not None and date < self.ingested_after:
+            return False
+        return self.ingested_before is None or date < self.ingested_before
+
+    def matches_page(self, page: str | int | None) -> bool:
+        if not self.has_page_range:
+            return True
+        # Page labels are strings; non-numeric labels (e.g. roman numerals) fall outside any range
+        _page = page_number(page)
+        if _page is None:
+            return False
+        if self.min_page is not None and _page < self.min_page:
+            return False
+        return self.max_page is None or _page <= self.max_page
+
+
+def page_number(page: str | int | None) -> int | None:
+    try:
+        return int(page)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,80 @@
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from models import DocumentChunk
+
+
+CacheKey = tuple
+
+
+@dataclass(eq=False)
+class CachedAnswer:
+    answer: str
+    chunks: list[DocumentChunk]
+    embedding: np.ndarray
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95,
+                 max_entries: int = 1024,
+                 ttl: float | None = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._partitions: dict[CacheKey, list[CachedAnswer]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(_entries) for _entries in self._partitions.values())
+
+    def lookup(self, key: CacheKey, embedding: list[float]) -> CachedAnswer | None:
+        _query = self._normalize(embedding)
+        with self._lock:
+            _entries = self._expire(key)
+            if _entries:
+                _similarities = np.stack([_entry.embedding for _entry in _entries]) @ _query
+                _best = int(np.argmax(_similarities))
+                if _similarities[_best] >= self.threshold:
+                    self.hits += 1
+                    _entries[_best].last_used = time.monotonic()
+                    return _entries[_best]
+            self.misses += 1
+            return None
+
+    def insert(self, key: CacheKey, embedding: list[float],
+               answer: str, chunks: list[DocumentChunk]):
+        with self._lock:
+            self._partitions.setdefault(key, []).append(
+                CachedAnswer(answer, chunks, self._normalize(embedding)))
+            while len(self) > self.max_entries:
+                self._evict_least_recently_used()
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def _expire(self, key: CacheKey) -> list[CachedAnswer]:
+        _entries = self._partitions.get(key, [])
+        if self.ttl is not None:
+            _cutoff = time.monotonic() - self.ttl
+            _entries[:] = [_entry for _entry in _entries if _entry.created >= _cutoff]
+        return _entries
+
+    def _evict_least_recently_used(self):
+        _key, _entry = min(((_key, _entry) for _key, _entries in self._partitions.items()
+                            for _entry in _entries), key=lambda item: item[1].last_used)
+        self._partitions[_key].remove(_entry)
+        if not self._partitions[_key]:
+            del self._partitions[_key]
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        _vector = np.asarray(embedding, dtype=np.float32)
+        return _vector / max(float(np.linalg.norm(_vector)), np.finfo(np.float32).eps)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+
+from rag.rag import RAG
+
+
+COLUMNS = ('question', 'answer', 'context', 'ground_truth')
+
+
+def read_records(jsonl_path: str | Path) -> dict[int, dict]:
+    _records = {}
+    try:
+        with open(jsonl_path) as f:
+            for _line in f:
+                if _line.strip():
+                    _record = json.loads(_line)
+                    _records[_record['index']] = _record
+    except FileNotFoundError:
+        pass
+    return _records
+
+
+def write_columnar_output(jsonl_path: str | Path, output_json_path: str | Path,
+                          metadata: dict | None = None):
+    _records = [_record for _, _record in sorted(read_records(jsonl_path).items())]
+    data: dict = {_column: [_record[_column] for _record in _records] for _column in COLUMNS}
+    data['metadata'] = {**(metadata or {}), 'seconds': [_record['seconds'] for _record in _records]}
+    with open(output_json_path, 'w') as file:
+        json.dump(data, file, indent=4)
+
+
+async def arun_batch(rag: RAG, qa_json_path: str, output_jsonl_path: str,
+                     output_json_path: str | None = None,
+                     metadata: dict | None = None,
+                     concurrency: int = 4,
+                     timeout: float | None = None) -> dict[int, dict]:
+    with open(qa_json_path) as f:
+        qa: dict[str, list[str]] = json.load(f)
+    _records = read_records(output_jsonl_path)
+    _todo = [(_i, _q, _a) for _i, (_q, _a) in enumerate(zip(qa['question'], qa['answer']))
+             if _i not in _records or _records[_i]['error'] is not None]
+    logging.info(f"Answering {len(_todo)} questions, "
+                 f"{len(qa['question']) - len(_todo)} already answered in {output_jsonl_path}")
+
+    _semaphore = asyncio.Semaphore(concurrency)
+    with open(output_jsonl_path, 'a') as output:
+        async def _answer(index: int, question: str, ground_truth: str):
+            async with _semaphore:
+                _start = time.perf_counter()
+                _error = None
+                try:
+                    response, context = await asyncio.wait_for(rag.agenerate(question, []), timeout)
+                except asyncio.TimeoutError:
+                    _error = f"Timed out after {timeout}s"
+                    response, context = "Failed (took too long)", []
+                except Exception as e:
+                    _error = f"{type(e).__name__}: {e}"
+                    response, context = f"Failed ({_error})", []
+                _seconds = time.perf_counter() - _start
+            if _error:
+                logging.error(f"Question {index} failed: {_error}")
+            print('Question:')
+            print(question, end='\n\n')
+
+            print('Answer:')
+            print(response, end='\n\n')
+
+            print('Ground Truth:')
+            print(ground_truth, end='\n\n')
+            print("##############################################################################################")
+            _records[index] = {
+                'index': index,
+                'question': question,
+                'answer': response,
+                'context': [chunk.text + "\n\nSOURCE: " + chunk.document_name for chunk in context],
+                'ground_truth': ground_truth,
+                'seconds': _seconds,
+                'error': _error,
+            }
+            output.write(json.dumps(_records[index]) + '\n')
+            output.flush()
+
+        try:
+            await asyncio.gather(*[_answer(_i, _q, _a) for _i, _q, _a in _todo])
+        finally:
+            # The async driver is bound to this loop, which ends with the batch
+            await rag.vector_store.aclose_async_driver()
+
+    if output_json_path:
+        write_columnar_output(output_jsonl_path, output_json_path, metadata)
+    return _records
+
+
+def run_batch(rag: RAG, qa_json_path: str, output_jsonl_path: str,
+              output_json_path: str | None = None,
+              metadata: dict | None = None,
+              concurrency: int = 4,
+              timeout: float | None = None) -> dict[int, dict]:
+    return asyncio.run(arun_batch(rag, qa_json_path, output_jsonl_path, output_json_path,
+                                  metadata, concurrency, timeout))
@@ -0,0 +1,178 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+from llama_index.core.utils import get_tokenizer
+
+import telemetry
+from models import DocumentChunk
+
+
+CONTEXT_HEADER = "Piece of context from document: {}\n"
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+@dataclass
+class PackedContext:
+    text: str
+    chunks: list[DocumentChunk]
+    tokens: int
+    tokens_saved: int
+
+
+def build_context(chunks: list[DocumentChunk]) -> str:
+    return "".join(CONTEXT_HEADER.format(_chunk.document_name) + _chunk.text + "\n\n" for _chunk in chunks)
+
+
+class ContextPacker:
+    def __init__(self, token_budget: int | None = 2048,
+                 mmr_lambda: float | None = None,
+                 fetch_multiplier: int = 3,
+                 min_overlap: int = 30,
+                 min_sentence_length: int = 20,
+                 tokenizer: Callable[[str], list] | None = None):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.fetch_multiplier = fetch_multiplier
+        self.min_overlap = min_overlap
+        self.min_sentence_length = min_sentence_length
+        self.tokenizer = tokenizer or get_tokenizer()
+
+    @property
+    def uses_mmr(self) -> bool:
+        return self.mmr_lambda is not None
+
+    def fetch_size(self, num_chunks: int) -> int:
+        return num_chunks * self.fetch_multiplier if self.uses_mmr else num_chunks
+
+    def pack(self, chunks: list[DocumentChunk],
+             query_embedding: list[float] | None = None,
+             num_chunks: int | None = None) -> PackedContext:
+        _num_chunks = num_chunks or len(chunks)
+        if self.uses_mmr and query_embedding is not None and len(chunks) > _num_chunks:
+            _selected = self._mmr(chunks, query_embedding, _num_chunks)
+        else:
+            _selected = chunks[:_num_chunks]
+        _baseline = self._count(build_context(_selected))
+
+        _packed = self._deduplicate(self._merge(_selected))
+        _blocks, _tokens = self._fit(_packed)
+        _text = "".join(_blocks)
+        _saved = _baseline - _tokens
+        logging.info(f"Packed {len(_selected)} chunks into {len(_blocks)} blocks, "
+                     f"{_tokens} tokens ({_saved} saved)")
+        telemetry.record('rag.context_tokens', _tokens)
+        telemetry.record('rag.context_tokens_saved', _saved)
+        return PackedContext(_text, _packed[:len(_blocks)], _tokens, _saved)
+
+    def _mmr(self, chunks: list[DocumentChunk], query_embedding: list[float], k: int) -> list[DocumentChunk]:
+        if any(len(_chunk.embedding) == 0 for _chunk in chunks):
+            logging.warning("MMR needs chunk embeddings, keeping retrieval order")
+            return chunks[:k]
+        _embeddings = np.asarray([_chunk.embedding for _chunk in chunks], dtype=np.float32)
+        _embeddings /= np.maximum(np.linalg.norm(_embeddings, axis=1, keepdims=True), np.finfo(np.float32).eps)
+        _query = np.asarray(query_embedding, dtype=np.float32)
+        _relevance = _embeddings @ (_query / max(float(np.linalg.norm(_query)), np.finfo(np.float32).eps))
+        _similarity = _embeddings @ _embeddings.T
+
+        _selected = [int(np.argmax(_relevance))]
+        _redundancy = _similarity[_selected[0]].copy()
+        for _ in range(1, k):
+            _scores = self.mmr_lambda * _relevance - (1 - self.mmr_lambda) * _redundancy
+            _scores[_selected] = -np.inf
+            _next = int(np.argmax(_scores))
+            _selected.append(_next)
+            _redundancy = np.maximum(_redundancy, _similarity[_next])
+        return [chunks[_i] for _i in _selected]
+
+    def _merge(self, chunks: list[DocumentChunk]) -> list[DocumentChunk]:
+        # Chunks from the same page are merged in place of the best ranked one, so rank order is kept
+        _merged: list[DocumentChunk] = []
+        _groups: dict[tuple[str, str], list[int]] = {}
+        for _chunk in chunks:
+            _key = (_chunk.document_name, _chunk.page)
+            for _i in _groups.get(_key, []):
+                if (_text := self._join(_merged[_i].text, _chunk.text)) is not None:
+                    _merged[_i] = DocumentChunk(_text, _chunk.document_name, _chunk.document_path,
+                                                _chunk.page, _merged[_i].embedding)
+                    break
+            else:
+                _groups.setdefault(_key, []).append(len(_merged))
+                _merged.append(_chunk)
+        return _merged
+
+    def _join(self, first: str, second: str) -> str | None:
+        if second in first:
+            return first
+        if first in second:
+            return second
+        for _head, _tail in ((first, second), (second, first)):
+            # Look for the tail's opening as a suffix of the head, as left behind by chunk_overlap
+            _start = _head.find(_tail[:self.min_overlap])
+            while _start != -1:
+                if _tail.startswith(_head[_start:]):
+                    return _head[:_start] + _tail
+                _start = _head.find(_tail[:self.min_overlap], _start + 1)
+        return None
+
+    def _deduplicate(self, chunks: list[DocumentChunk]) -> list[DocumentChunk]:
+        # Page overlap copies sentences across pages; keep only their first occurrence
+        _seen: set[str] = set()
+        _deduplicated = []
+        for _chunk in chunks:
+            # Sentences are spliced out together with the whitespace after them, so the rest of the
+            # text keeps its own line breaks and layout
+            _pieces = []
+            _dropped = _dropped_last = False
+            _start = 0
+            for _end in [_match.end() for _match in _SENTENCE_END.finditer(_chunk.text)] + [len(_chunk.text)]:
+                _piece = _chunk.text[_start:_end]
+                _start = _end
+                _key = " ".join(_piece.split()).lower()
+                _dropped_last = len(_key) >= self.min_sentence_length and _key in _seen
+                if _dropped_last:
+                    _dropped = True
+                    continue
+                if len(_key) >= self.min_sentence_length:
+                    _seen.add(_key)
+                _pieces.append(_piece)
+            if not _dropped:
+                _deduplicated.append(_chunk)
+            elif _pieces:
+                if _dropped_last:
+                    _pieces[-1] = _pieces[-1].rstrip()
+                _deduplicated.append(DocumentChunk("".join(_pieces), _chunk.document_name, _chunk.document_path,
+                                                   _chunk.page, _chunk.embedding))
+        return _deduplicated
+
+    def _fit(self, chunks: list[DocumentChunk]) -> tuple[list[str], int]:
+        _blocks = []
+        _tokens = 0
+        for _chunk in chunks:
+            _block = CONTEXT_HEADER.format(_chunk.document_name) + _chunk.text + "\n\n"
+            _block_tokens = self._count(_block)
+            if self.token_budget is not None and _tokens + _block_tokens > self.token_budget:
+                _block, _block_tokens = self._truncate(_chunk, self.token_budget - _tokens)
+                if _block:
+                    _blocks.append(_block)
+                    _tokens += _block_tokens
+                break
+            _blocks.append(_block)
+            _tokens += _block_tokens
+        return _blocks, _tokens
+
+    def _truncate(self, chunk: DocumentChunk, budget: int) -> tuple[str, int]:
+        # Drop whole sentences from the end until the block fits what is left of the budget
+        _sentences = _SENTENCE_END.split(chunk.text)
+        while _sentences:
+            _block = CONTEXT_HEADER.format(chunk.document_name) + " ".join(_sentences) + "\n\n"
+            if (_block_tokens := self._count(_block)) <= budget:
+                return _block, _block_tokens
+            _sentences.pop()
+        return "", 0
+
+    def _count(self, text: str) -> int:
+        return len(self.tokenizer(text))
@@ -1,4 +1,6 @@
+import logging
 from itertools import pairwise
+from pathlib import Path
 
 from llama_index.core import Document
 from llama_index.core import SimpleDirectoryReader
@@ -6,47 +8,100 @@ from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter
 
 from models.document_chunk import DocumentChunk
+from rag.manifest import file_hash
+from rag.parse_cache import ParseCache
 
 
 class DocumentLoader:
-    def __init__(self, chunk_size=300, chunk_overlap=60):
+    def __init__(self, chunk_size=300, chunk_overlap=60, num_workers: int | None = None,
+                 parse_cache: ParseCache | None = None):
         self.pipeline = IngestionPipeline(
             transformations=[
                 SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap),
             ],
         )
+        self.num_workers = num_workers
+        self.parse_cache = parse_cache
         self.documents: list[Document] = []
 
     def load_directory(self, directory):
         reader = SimpleDirectoryReader(input_dir=directory)
-        self.documents += reader.load_data()
+        self.documents += reader.load_data(num_workers=self.num_workers)
 
     def load_file(self, file):
-        reader = SimpleDirectoryReader(input_files=[file])
-        self.documents += reader.load_data()
+        self.documents += self.read_file(file)
+
+    def load_files(self, files):
+        if self.parse_cache is None:
+            # Files are spread over the worker pool but results keep input order
+            reader = SimpleDirectoryReader(input_files=files)
+            self.documents += reader.load_data(num_workers=self.num_workers)
+            return
+
+        _digests = {str(Path(_file)): file_hash(_file) for _file in files}
+        _documents = {_key: self.parse_cache.get(_key, _digest) for _key, _digest in _digests.items()}
+        _missing = [_key for _key, _cached in _documents.items() if _cached is None]
+        logging.info(f"Parse cache: {len(files) - len(_missing)} hits, {len(_missing)} misses")
+        if _missing:
+            reader = SimpleDirectoryReader(input_files=_missing)
+            for _key in _missing:
+                _documents[_key] = []
+            for _document in reader.load_data(num_workers=self.num_workers):
+                _documents[str(Path(_document.metadata['file_path']))].append(_document)
+            for _key in _missing:
+                self.parse_cache.put(_key, _documents[_key], _digests[_key])
+        for _file in files:
+            self.documents += _documents[str(Path(_file))]
+
+    def read_file(self, file) -> list[Document]:
+        if self.parse_cache is None:
+            return SimpleDirectoryReader(input_files=[file]).load_data()
+        _digest = file_hash(file)
+        if (_documents := self.parse_cache.get(file, _digest)) is None:
+            _documents = SimpleDirectoryReader(input_files=[file]).load_data()
+            self.parse_cache.put(file, _documents, _digest)
+        return _documents
 
     def overlap_pages(self, overlap_ratio=0.15, delimiters=(".", "!", "?", "\n")):
-        page_pairs = list(filter(
-            lambda p: p[0].metadata["file_name"] == p[1].metadata["file_name"]
-            and p[0].metadata["page_label"] != p[1].metadata["page_label"],
-            pairwise(self.documents)))
-
-        for (page1, page2) in page_pairs:
-            text1 = page1.text
-            text2 = page2.text
-            text1_overlap = text1[-int(overlap_ratio * len(text1)):]
-            text2_overlap = text2[:int(overlap_ratio * len(text2))]
-            split_index1 = min([text1_overlap.rfind(delimiter) for delimiter in delimiters])
-            split_index2 = max([text2_overlap.find(delimiter) for delimiter in delimiters])
-            page1.text += text2[:split_index2]
-            page2.text = text1[split_index1:] + page2.text
+        overlap_pages(self.documents, overlap_ratio, delimiters)
 
     def split(self) -> list[DocumentChunk]:
+        return self.split_documents(self.documents)
+
+    def split_documents(self, documents: list[Document]) -> list[DocumentChunk]:
         nodes = self.pipeline.run(
-            documents=self.documents)
+            documents=documents, num_workers=self.num_workers)
         return [DocumentChunk.from_llama_index_node(node) for node in nodes]
 
 
+def load_file_chunks(file, chunk_size=300, chunk_overlap=60,
+                     overlap_ratio: float | None = None,
+                     parse_cache: ParseCache | None = None) -> list[DocumentChunk]:
+    loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap, parse_cache=parse_cache)
+    documents = loader.read_file(file)
+    if overlap_ratio is not None:
+        overlap_pages(documents, overlap_ratio)
+    return loader.split_documents(documents)
+
+
+def overlap_pages(documents: list[Document], overlap_ratio=0.15,
+                  delimiters=(".", "!", "?", "\n")):
+    page_pairs = list(filter(
+        lambda p: p[0].metadata["file_name"] == p[1].metadata["file_name"]
+        and p[0].metadata["page_label"] != p[1].metadata["page_label"],
+        pairwise(documents)))
+
+    for (page1, page2) in page_pairs:
+        text1 = page1.text
+        text2 = page2.text
+        text1_overlap = text1[-int(overlap_ratio * len(text1)):]
+        text2_overlap = text2[:int(overlap_ratio * len(text2))]
+        split_index1 = min([text1_overlap.rfind(delimiter) for delimiter in delimiters])
+        split_index2 = max([text2_overlap.find(delimiter) for delimiter in delimiters])
+        page1.text += text2[:split_index2]
+        page2.text = text1[split_index1:] + page2.text
+
+
 if __name__ == "__main__":
     ds = DocumentLoader()
     ds.load_directory("data")
@@ -0,0 +1,161 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from datasets import Dataset
+from llama_index.core.utils import get_tokenizer
+from ragas import evaluate as ragas_evaluate
+from ragas.metrics import (
+    answer_relevancy,
+    faithfulness,
+    context_recall,
+    context_precision,
+    answer_correctness,
+    answer_similarity
+)
+
+
+METRICS = [
+    answer_relevancy,
+    faithfulness,
+    context_recall,
+    context_precision,
+    answer_correctness,
+    answer_similarity
+]
+
+COLUMNS = ('question', 'answer', 'contexts', 'ground_truth')
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        # The amount is taken up front, possibly into debt, and the caller waits until it is paid back
+        with self._lock:
+            _now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (_now - self._updated) * self.rate)
+            self._updated = _now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float | None = None,
+                 tokens_per_minute: float | None = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, requests: float, tokens: float) -> float:
+        _wait = max(self.requests.reserve(requests) if self.requests else 0.0,
+                    self.tokens.reserve(tokens) if self.tokens else 0.0)
+        if _wait > 0:
+            time.sleep(_wait)
+        return _wait
+
+
+def load_rag_output(rag_output_path: str | Path) -> dict[str, list]:
+    with open(rag_output_path) as f:
+        data = json.load(f)
+    if 'contexts' not in data and 'context' in data:
+        data['contexts'] = data['context']
+        del data['context']
+    if 'metadata' in data:
+        del data['metadata']
+    return data
+
+
+def evaluate_sharded(rag_output_path: str | Path, results_path: str | Path,
+                     shard_size: int = 8,
+                     concurrency: int = 2,
+                     requests_per_minute: float | None = None,
+                     tokens_per_minute: float | None = None,
+                     requests_per_sample: int | None = None,
+                     metrics: list | None = None) -> dict[str, float]:
+    _metrics = metrics or METRICS
+    data = load_rag_output(rag_output_path)
+    _samples = len(data['question'])
+    _shards = [(_start, min(_start + shard_size, _samples)) for _start in range(0, _samples, shard_size)]
+
+    _directory = Path(f"{results_path}.shards")
+    _directory.mkdir(parents=True, exist_ok=True)
+    _plan = {'samples': _samples, 'shard_size': shard_size,
+             'metrics': [_metric.name for _metric in _metrics]}
+    _plan_path = _directory / 'plan.json'
+    if _plan_path.exists():
+        with open(_plan_path) as f:
+            if (_previous := json.load(f)) != _plan:
+                raise ValueError(f"Checkpoints in {_directory} were made for {_previous}, not {_plan}; "
+                                 f"remove the directory to start over")
+    else:
+        _write_json(_plan_path, _plan)
+
+    _todo = [(_i, _start, _end) for _i, (_start, _end) in enumerate(_shards)
+             if not _shard_path(_directory, _i).exists()]
+    logging.info(f"Evaluating {len(_todo)} of {len(_shards)} shards, "
+                 f"{len(_shards) - len(_todo)} already checkpointed in {_directory}")
+
+    # ragas makes the LLM calls itself, so the limiter admits whole shards by their estimated cost
+    _limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    _tokenizer = get_tokenizer()
+    _requests_per_sample = requests_per_sample or 2 * len(_metrics)
+
+    def _evaluate_shard(index: int, start: int, end: int):
+        _shard = {_column: data[_column][start:end] for _column in COLUMNS}
+        _tokens = len(_metrics) * sum(
+            len(_tokenizer(" ".join([_question, _answer, *_contexts, _ground_truth])))
+            for _question, _answer, _contexts, _ground_truth in zip(*_shard.values()))
+        if (_waited := _limiter.acquire(_requests_per_sample * (end - start), _tokens)) > 0:
+            logging.info(f"Shard {index} waited {_waited:.1f}s for the rate limit")
+        _results = ragas_evaluate(Dataset.from_dict(_shard), metrics=_metrics, raise_exceptions=False)
+        _records = json.loads(_results.to_pandas().to_json(orient='records'))
+        _write_json(_shard_path(_directory, index), {'start': start, 'end': end, 'records': _records})
+        logging.info(f"Evaluated shard {index} (samples {start}-{end})")
+
+    _errors = []
+    with ThreadPoolExecutor(max_workers=concurrency) as _executor:
+        _futures = {_executor.submit(_evaluate_shard, *_shard): _shard[0] for _shard in _todo}
+        for _future in as_completed(_futures):
+            try:
+                _future.result()
+            except Exception as e:
+                logging.error(f"Shard {_futures[_future]} failed: {type(e).__name__}: {e}")
+                _errors.append(e)
+    if _errors:
+        # Finished shards stay checkpointed, so running again only retries the failed ones
+        raise _errors[0]
+
+    _records = []
+    for _i in range(len(_shards)):
+        with open(_shard_path(_directory, _i)) as f:
+            _records += json.load(f)['records']
+    results_df = pd.DataFrame(_records)
+    results_df.to_json(f"{results_path}.json", indent=4)
+
+    _scores = {_metric.name: float(results_df[_metric.name].mean()) for _metric in _metrics
+               if _metric.name in results_df}
+    logging.info("Evaluation scores: " + ", ".join(
+        f"{_name} {_score:.3f}" for _name, _score in _scores.items() if not math.isnan(_score)))
+    return _scores
+
+
+def _shard_path(directory: Path, index: int) -> Path:
+    return directory / f"shard_{index:05d}.json"
+
+
+def _write_json(path: Path, data):
+    _tmp_path = path.with_name(path.name + '.tmp')
+    with open(_tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(_tmp_path, path)
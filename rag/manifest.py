@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    _hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while _block := f.read(block_size):
+            _hash.update(_block)
+    return _hash.hexdigest()
+
+
+def list_files(paths: Path | list[Path]) -> list[Path]:
+    if isinstance(paths, Path):
+        paths = [paths]
+    _files = []
+    for path in paths:
+        if path.is_dir():
+            # Same selection as SimpleDirectoryReader's defaults: absolute paths, top level only, no hidden files
+            _files += sorted(_file for _file in path.resolve().iterdir()
+                             if _file.is_file() and not _file.name.startswith('.'))
+        else:
+            _files.append(path)
+    return _files
+
+
+class Manifest:
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.parameters: dict = {}
+        self.files: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                _data = json.load(f)
+            self.parameters = _data['parameters']
+            self.files = _data['files']
+
+    def save(self):
+        _tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(_tmp_path, 'w') as f:
+            json.dump({'parameters': self.parameters, 'files': self.files}, f, indent=4)
+        os.replace(_tmp_path, self.path)
@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+import pyarrow as pa
+from llama_index.core import Document
+from llama_index.core.readers.file.base import default_file_metadata_func
+
+from rag.manifest import file_hash
+
+
+_SCHEMA = pa.schema([
+    ('text', pa.large_string()),
+    ('metadata', pa.string()),
+    ('excluded_embed_metadata_keys', pa.list_(pa.string())),
+    ('excluded_llm_metadata_keys', pa.list_(pa.string())),
+])
+
+
+class ParseCache:
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, file: Path | str, digest: str | None = None) -> list[Document] | None:
+        _path = self._path(digest or file_hash(file))
+        if not _path.exists():
+            return None
+        try:
+            with pa.memory_map(str(_path)) as _source:
+                _table = pa.ipc.open_file(_source).read_all()
+        except (OSError, pa.ArrowInvalid) as e:
+            logging.warning(f"Ignoring unreadable parse cache entry {_path}: {e}")
+            return None
+
+        # Pages are keyed by content, so file metadata is refreshed for the path they are loaded from
+        _file_metadata = default_file_metadata_func(str(file))
+        return [Document(text=_row['text'],
+                         metadata=json.loads(_row['metadata']) | _file_metadata,
+                         excluded_embed_metadata_keys=_row['excluded_embed_metadata_keys'],
+                         excluded_llm_metadata_keys=_row['excluded_llm_metadata_keys'])
+                for _row in _table.to_pylist()]
+
+    def put(self, file: Path | str, documents: list[Document], digest: str | None = None):
+        _path = self._path(digest or file_hash(file))
+        _table = pa.Table.from_pydict({
+            'text': [_document.text for _document in documents],
+            'metadata': [json.dumps(_document.metadata) for _document in documents],
+            'excluded_embed_metadata_keys': [_document.excluded_embed_metadata_keys for _document in documents],
+            'excluded_llm_metadata_keys': [_document.excluded_llm_metadata_keys for _document in documents],
+        }, schema=_SCHEMA)
+        # Written aside and renamed so parallel workers never read a partial file
+        _tmp_path = _path.with_name(f"{_path.name}.{os.getpid()}.tmp")
+        with pa.OSFile(str(_tmp_path), 'wb') as _sink:
+            with pa.ipc.new_file(_sink, _SCHEMA) as _writer:
+                _writer.write_table(_table)
+        os.replace(_tmp_path, _path)
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / f"{digest}.arrow"
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from queue import Queue, Full
+from typing import Iterable, Iterator
+
+import numpy as np
+
+import telemetry
+from llm.base import Embedding
+from models import DocumentChunk
+from rag.document_loader import load_file_chunks
+from rag.parse_cache import ParseCache
+from vector_store.base import VectorStore
+
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.items} chunks in {self.seconds:.2f}s ({self.throughput:.1f} chunks/s)"
+
+
+@dataclass
+class _Failure:
+    exception: BaseException
+
+
+class StreamingIngestion:
+    def __init__(self, vector_store: VectorStore,
+                 embedding_model: Embedding,
+                 chunk_size: int = 300,
+                 chunk_overlap: int = 60,
+                 overlap_pages: bool = False,
+                 overlap_ratio: float = 0.15,
+                 window_size: int = 256,
+                 queue_size: int = 4,
+                 num_workers: int | None = None,
+                 embedding_dtype: type | np.dtype = np.float32,
+                 parse_cache: ParseCache | None = None):
+        self.vector_store = vector_store
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.overlap_pages = overlap_pages
+        self.overlap_ratio = overlap_ratio
+        self.window_size = window_size
+        self.queue_size = queue_size
+        self.num_workers = num_workers
+        self.embedding_dtype = embedding_dtype
+        self.parse_cache = parse_cache
+        self.stats: dict[str, StageStats] = {}
+
+    def run(self, files: list[Path]) -> dict[str, StageStats]:
+        self.stats = {_name: StageStats(_name) for _name in ('parse', 'embed', 'store')}
+        _stop = threading.Event()
+        try:
+            _windows = self._prefetch(self._parse(files), _stop)
+            _embedded = self._prefetch(self._embed(_windows), _stop)
+            for _window in _embedded:
+                self._timed('store', len(_window), self.vector_store.add_batch_chunks, _window)
+        finally:
+            _stop.set()
+        for _stage in self.stats.values():
+            logging.info(f"Ingestion {_stage}")
+        return self.stats
+
+    def _parse(self, files: list[Path]) -> Iterator[list[DocumentChunk]]:
+        _window: list[DocumentChunk] = []
+        _stats = self.stats['parse']
+        _start = time.perf_counter()
+        for _chunks in self._parse_files(files):
+            _seconds = time.perf_counter() - _start
+            telemetry.record('ingest.parse', _seconds, chunks=len(_chunks))
+            _stats.seconds += _seconds
+            _stats.items += len(_chunks)
+            logging.info(f"Ingestion {_stats}")
+            _window += _chunks
+            while len(_window) >= self.window_size:
+                yield _window[:self.window_size]
+                _window = _window[self.window_size:]
+            _start = time.perf_counter()
+        if _window:
+            yield _window
+
+    def _parse_files(self, files: list[Path]) -> Iterator[list[DocumentChunk]]:
+        _args = (self.chunk_size, self.chunk_overlap,
+                 self.overlap_ratio if self.overlap_pages else None, self.parse_cache)
+        if not self.num_workers or self.num_workers <= 1:
+            for _file in files:
+                yield load_file_chunks(_file, *_args)
+            return
+
+        # Keep a bounded number of files in flight so parsed chunks cannot pile up ahead of embedding
+        with ProcessPoolExecutor(max_workers=self.num_workers) as _executor:
+            _files = iter(files)
+            _pending = deque(_executor.submit(load_file_chunks, _file, *_args)
+                             for _file in islice(_files, 2 * self.num_workers))
+            while _pending:
+                _chunks = _pending.popleft().result()
+                if (_file := next(_files, None)) is not None:
+                    _pending.append(_executor.submit(load_file_chunks, _file, *_args))
+                yield _chunks
+
+    def _embed(self, windows: Iterable[list[DocumentChunk]]) -> Iterator[list[DocumentChunk]]:
+        for _window in windows:
+            _embeddings = self._timed('embed', len(_window),
+                                      self.embedding_model.get_text_embedding_batch,
+                                      [_chunk.text for _chunk in _window])
+            DocumentChunk.attach_embeddings(_window, _embeddings, self.embedding_dtype)
+            yield _window
+
+    def _timed(self, stage: str, items: int, function, *args):
+        _start = time.perf_counter()
+        _result = function(*args)
+        _seconds = time.perf_counter() - _start
+        telemetry.record(f'ingest.{stage}', _seconds, chunks=items)
+        _stats = self.stats[stage]
+        _stats.seconds += _seconds
+        _stats.items += items
+        logging.info(f"Ingestion {_stats}")
+        return _result
+
+    def _prefetch(self, iterable: Iterable, stop: threading.Event) -> Iterator:
+        # Runs the upstream stage in a background thread, handing items over through a bounded queue
+        _queue = Queue(maxsize=self.queue_size)
+
+        def _put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    _queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def _worker():
+            try:
+                for _item in iterable:
+                    if not _put(_item):
+                        return
+            except BaseException as e:
+                _put(_Failure(e))
+            _put(_DONE)
+
+        threading.Thread(target=_worker, daemon=True).start()
+        while (_item := _queue.get()) is not _DONE:
+            if isinstance(_item, _Failure):
+                raise _item.exception
+            yield _item
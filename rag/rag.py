@@ -1,7 +1,17 @@
+import hashlib
+import json
+import logging
+import re
+from typing import AsyncGenerator, AsyncIterator, Generator, Iterator
+from pathlib import Path
+
 from llama_index.core.llms import MessageRole
 
+import telemetry
 from llm.base import LLM, DEFAULT_LANGUAGE
-from models import DocumentChunk
+from models import DocumentChunk, RetrievalFilter
+from rag.answer_cache import CachedAnswer, SemanticCache
+from rag.context import ContextPacker, build_context
 from rag.retriever import Retriever
 
 
@@ -9,7 +19,9 @@ class RAG(Retriever):
     def __init__(self, vector_store, embedding_model,
                  llm: LLM | None = None,
                  num_chunks: int = 5,
-                 language: str = DEFAULT_LANGUAGE):
+                 language: str = DEFAULT_LANGUAGE,
+                 answer_cache: SemanticCache | None = None,
+                 context_packer: ContextPacker | None = None):
         super().__init__(vector_store, embedding_model)
         self.llm = llm
         if self.llm is not None and self.llm.language != language:
@@ -17,41 +29,208 @@ class RAG(Retriever):
 
         self.num_chunks = num_chunks
         self.language = language
+        self.answer_cache = answer_cache
+        self.context_packer = context_packer
+
+    def load_data_sources(self, paths: Path | list[Path], *args, **kwargs):
+        super().load_data_sources(paths, *args, **kwargs)
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+
+    def sync_data_sources(self, paths: Path | list[Path], *args, **kwargs) -> dict[str, list[str]]:
+        _changes = super().sync_data_sources(paths, *args, **kwargs)
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+        return _changes
+
+    def _prepare_inputs(self, prompt: str, use_rag: bool,
+                        filters: RetrievalFilter | None = None,
+                        history: list[tuple[MessageRole, str]] | None = None) -> tuple[
+            str | None, list[DocumentChunk], list[float] | None, CachedAnswer | None]:
+        if self.language != DEFAULT_LANGUAGE:
+            with telemetry.span('rag.translate', language=self.language):
+                prompt = self.llm.generate(
+                    f"Translate this from {self.language} to English: " + prompt, [])
+            logging.debug(f"Translated prompt: {prompt}")
+        context = None
+        chunks = []
+        query_embedding = None
+        if use_rag:
+            with telemetry.span('rag.embed_query'):
+                query_embedding = self.embedding_model.get_query_embedding(prompt)
+            cached = self._lookup_answer(query_embedding, filters, history)
+            if cached is not None:
+                return None, cached.chunks, query_embedding, cached
+            chunks = self.retrieve_by_embedding(query_embedding, self._fetch_size(), filters,
+                                                include_embeddings=self._needs_embeddings())
+            context, chunks = self._pack_context(chunks, query_embedding)
+        return context, chunks, query_embedding, None
 
-    def _prepare_inputs(self, prompt: str,
-                        use_rag: bool) -> tuple[str, list[DocumentChunk]]:
+    async def _aprepare_inputs(self, prompt: str, use_rag: bool,
+                               filters: RetrievalFilter | None = None,
+                               history: list[tuple[MessageRole, str]] | None = None) -> tuple[
+            str | None, list[DocumentChunk], list[float] | None, CachedAnswer | None]:
         if self.language != DEFAULT_LANGUAGE:
-            prompt = self.llm.generate(
-                f"Translate this from {self.language} to English: " + prompt, [])
-            print(prompt)
+            with telemetry.span('rag.translate', language=self.language):
+                prompt = await self.llm.agenerate(
+                    f"Translate this from {self.language} to English: " + prompt, [])
+            logging.debug(f"Translated prompt: {prompt}")
         context = None
         chunks = []
+        query_embedding = None
         if use_rag:
-            chunks = self.retrieve(prompt, num_chunks=self.num_chunks)
-            context = ""
-            for chunk in chunks:
-                context += "Piece of context from document: " + chunk.document_name + "\n"
-                context += chunk.text + "\n\n"
-        return context, chunks
+            with telemetry.span('rag.embed_query'):
+                query_embedding = await self.embedding_model.aget_query_embedding(prompt)
+            cached = self._lookup_answer(query_embedding, filters, history)
+            if cached is not None:
+                return None, cached.chunks, query_embedding, cached
+            chunks = await self.aretrieve_by_embedding(query_embedding, self._fetch_size(), filters,
+                                                       include_embeddings=self._needs_embeddings())
+            context, chunks = self._pack_context(chunks, query_embedding)
+        return context, chunks, query_embedding, None
+
+    @staticmethod
+    def _build_context(chunks: list[DocumentChunk]) -> str:
+        return build_context(chunks)
+
+    def _fetch_size(self) -> int:
+        if self.context_packer is None:
+            return self.num_chunks
+        return self.context_packer.fetch_size(self.num_chunks)
+
+    def _needs_embeddings(self) -> bool:
+        return self.context_packer is not None and self.context_packer.uses_mmr
+
+    def _pack_context(self, chunks: list[DocumentChunk],
+                      query_embedding: list[float]) -> tuple[str, list[DocumentChunk]]:
+        if self.context_packer is None:
+            return self._build_context(chunks), chunks
+        with telemetry.span('rag.pack_context', chunks=len(chunks)):
+            _packed = self.context_packer.pack(chunks, query_embedding, self.num_chunks)
+        return _packed.text, _packed.chunks
 
     def generate(
             self, prompt: str,
             history: list[tuple[MessageRole, str]],
-            use_rag: bool = True
+            use_rag: bool = True,
+            filters: RetrievalFilter | None = None
     ) -> tuple[str, list[DocumentChunk]]:
-        context, chunks = self._prepare_inputs(prompt, use_rag)
-        if self.llm is None:
-            response = ""
-        else:
-            response = self.llm.generate(prompt, history, context)
-        return response, chunks
+        with telemetry.span('rag.generate') as _span:
+            context, chunks, query_embedding, cached = self._prepare_inputs(prompt, use_rag, filters, history)
+            _span.set(cached=cached is not None)
+            if cached is not None:
+                return cached.answer, cached.chunks
+            if self.llm is None:
+                response = ""
+            else:
+                response = self.llm.generate(prompt, history, context)
+                self._store_answer(query_embedding, response, chunks, filters, history)
+            return response, chunks
 
     def generate_stream(
             self, prompt: str,
             history: list[tuple[MessageRole, str]],
-            use_rag: bool = True
+            use_rag: bool = True,
+            filters: RetrievalFilter | None = None
     ):
-        context, chunks = self._prepare_inputs(prompt, use_rag)
+        with telemetry.span('rag.prepare_stream') as _span:
+            context, chunks, query_embedding, cached = self._prepare_inputs(prompt, use_rag, filters, history)
+            _span.set(cached=cached is not None)
+        if cached is not None:
+            return self._replay(cached.answer), cached.chunks
 
         stream = self.llm.generate_stream(prompt, history, context)
+        if self.answer_cache is not None:
+            stream = self._caching_stream(stream, query_embedding, chunks, filters, history)
+        return stream, chunks
+
+    async def agenerate(
+            self, prompt: str,
+            history: list[tuple[MessageRole, str]],
+            use_rag: bool = True,
+            filters: RetrievalFilter | None = None
+    ) -> tuple[str, list[DocumentChunk]]:
+        with telemetry.span('rag.generate') as _span:
+            context, chunks, query_embedding, cached = await self._aprepare_inputs(prompt, use_rag, filters, history)
+            _span.set(cached=cached is not None)
+            if cached is not None:
+                return cached.answer, cached.chunks
+            if self.llm is None:
+                response = ""
+            else:
+                response = await self.llm.agenerate(prompt, history, context)
+                self._store_answer(query_embedding, response, chunks, filters, history)
+            return response, chunks
+
+    async def agenerate_stream(
+            self, prompt: str,
+            history: list[tuple[MessageRole, str]],
+            use_rag: bool = True,
+            filters: RetrievalFilter | None = None
+    ) -> tuple[AsyncGenerator, list[DocumentChunk]]:
+        with telemetry.span('rag.prepare_stream') as _span:
+            context, chunks, query_embedding, cached = await self._aprepare_inputs(prompt, use_rag, filters, history)
+            _span.set(cached=cached is not None)
+        if cached is not None:
+            return self._areplay(cached.answer), cached.chunks
+
+        stream = self.llm.agenerate_stream(prompt, history, context)
+        if self.answer_cache is not None:
+            stream = self._acaching_stream(stream, query_embedding, chunks, filters, history)
         return stream, chunks
+
+    def _answer_cache_key(self, filters: RetrievalFilter | None = None,
+                          history: list[tuple[MessageRole, str]] | None = None) -> tuple:
+        # Filtered questions see a different corpus, so they get their own cache partition;
+        # so do follow-ups, partitioned by the earlier questions. A trailing user turn is the
+        # question being asked (the GUI appends it before generating), and replies are left out
+        # so that each answer variant does not start a partition of its own.
+        _turns = list(history or [])
+        if _turns and _turns[-1][0] == MessageRole.USER:
+            _turns.pop()
+        _questions = [_content for _role, _content in _turns if _role == MessageRole.USER]
+        _history = hashlib.sha256(json.dumps(_questions).encode()).hexdigest() if _questions else None
+        return self.llm.model_name, self.language, self.num_chunks, filters, _history
+
+    def _lookup_answer(self, query_embedding: list[float],
+                       filters: RetrievalFilter | None = None,
+                       history: list[tuple[MessageRole, str]] | None = None) -> CachedAnswer | None:
+        if self.answer_cache is None or self.llm is None:
+            return None
+        return self.answer_cache.lookup(self._answer_cache_key(filters, history), query_embedding)
+
+    def _store_answer(self, query_embedding: list[float] | None,
+                      response: str, chunks: list[DocumentChunk],
+                      filters: RetrievalFilter | None = None,
+                      history: list[tuple[MessageRole, str]] | None = None):
+        if self.answer_cache is not None and query_embedding is not None:
+            self.answer_cache.insert(self._answer_cache_key(filters, history), query_embedding, response, chunks)
+
+    def _caching_stream(self, stream: Iterator[str], query_embedding: list[float] | None,
+                        chunks: list[DocumentChunk],
+                        filters: RetrievalFilter | None = None,
+                        history: list[tuple[MessageRole, str]] | None = None) -> Generator:
+        _response = ""
+        for _token in stream:
+            _response += _token
+            yield _token
+        self._store_answer(query_embedding, _response, chunks, filters, history)
+
+    async def _acaching_stream(self, stream: AsyncIterator[str], query_embedding: list[float] | None,
+                               chunks: list[DocumentChunk],
+                               filters: RetrievalFilter | None = None,
+                               history: list[tuple[MessageRole, str]] | None = None) -> AsyncGenerator:
+        _response = ""
+        async for _token in stream:
+            _response += _token
+            yield _token
+        self._store_answer(query_embedding, _response, chunks, filters, history)
+
+    @staticmethod
+    def _replay(answer: str) -> Generator:
+        yield from re.findall(r'\s*\S+', answer)
+
+    @staticmethod
+    async def _areplay(answer: str) -> AsyncGenerator:
+        for _token in re.findall(r'\s*\S+', answer):
+            yield _token
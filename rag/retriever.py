@@ -1,8 +1,15 @@
+import logging
 from pathlib import Path
 
+import numpy as np
+
+import telemetry
 from rag.document_loader import DocumentLoader
+from rag.manifest import Manifest, file_hash, list_files
+from rag.parse_cache import ParseCache
+from rag.pipeline import StreamingIngestion
 from llm.base import Embedding
-from models import DocumentChunk
+from models import DocumentChunk, RetrievalFilter
 from vector_store.base import VectorStore
 
 
@@ -13,9 +20,49 @@ class Retriever:
         self.embedding_model = embedding_model
 
     def retrieve(self, query: str,
-                 num_chunks: int = 5) -> list[DocumentChunk]:
-        query_embedding = self.embedding_model.get_query_embedding(query)
-        ranked_chunks = self.vector_store.retrieve(query_embedding, num_chunks)
+                 num_chunks: int = 5,
+                 filters: RetrievalFilter | None = None) -> list[DocumentChunk]:
+        with telemetry.span('rag.embed_query'):
+            query_embedding = self.embedding_model.get_query_embedding(query)
+        return self.retrieve_by_embedding(query_embedding, num_chunks, filters)
+
+    def retrieve_by_embedding(self, query_embedding: list[float],
+                              num_chunks: int = 5,
+                              filters: RetrievalFilter | None = None,
+                              include_embeddings: bool = False) -> list[DocumentChunk]:
+        with telemetry.span('rag.vector_search', k=num_chunks, filtered=filters is not None):
+            ranked_chunks = self.vector_store.retrieve(query_embedding, num_chunks, include_embeddings, filters)
+        return [chunk for chunk, _ in ranked_chunks]
+
+    def retrieve_many(self, queries: list[str],
+                      num_chunks: int = 5,
+                      filters: RetrievalFilter | None = None) -> list[list[DocumentChunk]]:
+        with telemetry.span('rag.embed_query', queries=len(queries)):
+            query_embeddings = self.embedding_model.get_query_embedding_batch(queries)
+        return self.retrieve_many_by_embedding(query_embeddings, num_chunks, filters)
+
+    def retrieve_many_by_embedding(self, query_embeddings: list[list[float]],
+                                   num_chunks: int = 5,
+                                   filters: RetrievalFilter | None = None) -> list[list[DocumentChunk]]:
+        with telemetry.span('rag.vector_search', k=num_chunks, queries=len(query_embeddings),
+                            filtered=filters is not None):
+            ranked_chunks = self.vector_store.retrieve_many(query_embeddings, num_chunks, filters=filters)
+        return [[chunk for chunk, _ in _ranked] for _ranked in ranked_chunks]
+
+    async def aretrieve(self, query: str,
+                        num_chunks: int = 5,
+                        filters: RetrievalFilter | None = None) -> list[DocumentChunk]:
+        with telemetry.span('rag.embed_query'):
+            query_embedding = await self.embedding_model.aget_query_embedding(query)
+        return await self.aretrieve_by_embedding(query_embedding, num_chunks, filters)
+
+    async def aretrieve_by_embedding(self, query_embedding: list[float],
+                                     num_chunks: int = 5,
+                                     filters: RetrievalFilter | None = None,
+                                     include_embeddings: bool = False) -> list[DocumentChunk]:
+        with telemetry.span('rag.vector_search', k=num_chunks, filtered=filters is not None):
+            ranked_chunks = await self.vector_store.aretrieve(query_embedding, num_chunks,
+                                                              include_embeddings, filters)
         return [chunk for chunk, _ in ranked_chunks]
 
     def list_data_sources(self):
@@ -26,24 +73,101 @@ class Retriever:
                           overlap_ratio: float = 0.15,
                           reset_data_sources: bool = False,
                           chunk_size: int = 300,
-                          chunk_overlap: int = 60):
-        loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        if isinstance(paths, Path):
-            paths = [paths]
-        for path in paths:
-            if path.is_dir():
-                loader.load_directory(path)
-            else:
-                loader.load_file(path)
+                          chunk_overlap: int = 60,
+                          streaming: bool = False,
+                          window_size: int = 256,
+                          num_workers: int | None = None,
+                          embedding_dtype: type | np.dtype = np.float32,
+                          parse_cache: ParseCache | None = None):
+        if streaming:
+            if reset_data_sources:
+                self.vector_store.clear_data()
+            StreamingIngestion(self.vector_store, self.embedding_model,
+                               chunk_size=chunk_size,
+                               chunk_overlap=chunk_overlap,
+                               overlap_pages=overlap_pages,
+                               overlap_ratio=overlap_ratio,
+                               window_size=window_size,
+                               num_workers=num_workers,
+                               embedding_dtype=embedding_dtype,
+                               parse_cache=parse_cache).run(list_files(paths))
+            return
+
+        loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                num_workers=num_workers, parse_cache=parse_cache)
+        with telemetry.span('ingest.load'):
+            loader.load_files(list_files(paths))
         if overlap_pages:
-            loader.overlap_pages(overlap_ratio)
+            with telemetry.span('ingest.overlap'):
+                loader.overlap_pages(overlap_ratio)
 
-        chunks = loader.split()
-        chunk_embeddings = self.embedding_model.get_text_embedding_batch(
-            [chunk.text for chunk in chunks])
-        for chunk, embedding in zip(chunks, chunk_embeddings):
-            chunk.embedding = embedding
+        with telemetry.span('ingest.split'):
+            chunks = loader.split()
+        with telemetry.span('ingest.embed', chunks=len(chunks)):
+            chunk_embeddings = self.embedding_model.get_text_embedding_batch(
+                [chunk.text for chunk in chunks])
+        DocumentChunk.attach_embeddings(chunks, chunk_embeddings, embedding_dtype)
 
         if reset_data_sources:
             self.vector_store.clear_data()
-        self.vector_store.add_batch_chunks(chunks)
+        with telemetry.span('ingest.store', chunks=len(chunks)):
+            self.vector_store.add_batch_chunks(chunks)
+
+    def sync_data_sources(self, paths: Path | list[Path],
+                          manifest_path: Path | str,
+                          overlap_pages: bool = False,
+                          overlap_ratio: float = 0.15,
+                          chunk_size: int = 300,
+                          chunk_overlap: int = 60,
+                          streaming: bool = False,
+                          num_workers: int | None = None,
+                          parse_cache: ParseCache | None = None) -> dict[str, list[str]]:
+        manifest = Manifest(manifest_path)
+        _parameters = {
+            'chunk_size': chunk_size,
+            'chunk_overlap': chunk_overlap,
+            'overlap_pages': overlap_pages,
+            'overlap_ratio': overlap_ratio if overlap_pages else None,
+        }
+        _rechunk = manifest.parameters != _parameters
+        _current = {str(_file.resolve()): _file for _file in list_files(paths)}
+        # Chunks are stored under the file name alone, so two files sharing one would delete each other's
+        _names: dict[str, str] = {}
+        for _key, _file in _current.items():
+            if (_other := _names.setdefault(_file.name, _key)) != _key:
+                raise ValueError(f"{_other} and {_key} would both be stored as document {_file.name}; "
+                                 f"rename one or sync them into separate stores")
+        _hashes = {_key: file_hash(_file) for _key, _file in _current.items()}
+
+        _changes: dict[str, list[str]] = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+        for _key in _current:
+            if _key not in manifest.files:
+                _changes['added'].append(_key)
+            elif _rechunk or manifest.files[_key]['hash'] != _hashes[_key]:
+                _changes['changed'].append(_key)
+            else:
+                _changes['unchanged'].append(_key)
+        _changes['removed'] = [_key for _key in manifest.files if _key not in _current]
+
+        for _key in _changes['changed'] + _changes['removed']:
+            self.vector_store.delete_document(manifest.files[_key]['document_name'])
+            del manifest.files[_key]
+        manifest.parameters = _parameters
+        manifest.save()
+
+        _to_load = _changes['added'] + _changes['changed']
+        if _to_load:
+            self.load_data_sources([_current[_key] for _key in _to_load],
+                                   overlap_pages=overlap_pages,
+                                   overlap_ratio=overlap_ratio,
+                                   chunk_size=chunk_size,
+                                   chunk_overlap=chunk_overlap,
+                                   streaming=streaming,
+                                   num_workers=num_workers,
+                                   parse_cache=parse_cache)
+            for _key in _to_load:
+                manifest.files[_key] = {'hash': _hashes[_key], 'document_name': _current[_key].name}
+            manifest.save()
+        logging.info("Synced data sources: " + ", ".join(
+            f"{len(_files)} {_change}" for _change, _files in _changes.items()))
+        return _changes
@@ -1,90 +1,46 @@
-import json
-import os
 from pathlib import Path
 
-from datasets import Dataset
-from ragas import evaluate as ragas_evaluate
-from ragas.metrics import (
-    answer_relevancy,
-    faithfulness,
-    context_recall,
-    context_precision,
-    answer_correctness,
-    answer_similarity
-)
-import pandas as pd
-
 from rag import RAG
+from rag.batch import run_batch
+from rag.parse_cache import ParseCache
 
 
 def load_data_sources(rag: RAG, data_sources_dir: str,
                       reset_data_sources: bool = True,
                       chunk_size: int = 1024,
-                      chunk_overlap: int = 128):
+                      chunk_overlap: int = 128,
+                      parse_cache_dir: str | None = None):
     rag.load_data_sources(
         Path(data_sources_dir),
         reset_data_sources=reset_data_sources,
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
+        parse_cache=ParseCache(parse_cache_dir) if parse_cache_dir else None,
+    )
+
+
+def sync_data_sources(rag: RAG, data_sources_dir: str,
+                      manifest_path: str,
+                      chunk_size: int = 1024,
+                      chunk_overlap: int = 128,
+                      parse_cache_dir: str | None = None):
+    return rag.sync_data_sources(
+        Path(data_sources_dir),
+        manifest_path,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        parse_cache=ParseCache(parse_cache_dir) if parse_cache_dir else None,
     )
 
 
-def add_metadata_to_output_json(json_path: str, metadata: dict):
-    with open(json_path, 'r') as file:
-        data: dict = json.load(file)
-    data['metadata'] = metadata
-    with open(json_path, 'w') as file:
-        json.dump(data, file, indent=4)
-
-
-def append_to_output_file(file_path: str,
-                          question: str, answer: str,
-                          context: list[str], ground_truth: str):
-    try:
-        with open(file_path, 'r') as file:
-            data: dict = json.load(file)
-    except FileNotFoundError:
-        data = {}
-    if 'question' not in data:
-        data['question'] = []
-    if 'answer' not in data:
-        data['answer'] = []
-    if 'context' not in data:
-        data['context'] = []
-    if 'ground_truth' not in data:
-        data['ground_truth'] = []
-    data['question'].append(question)
-    data['answer'].append(answer)
-    data['context'].append(context)
-    data['ground_truth'].append(ground_truth)
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
-
-
-def run_on_dataset(rag: RAG, qa_json_path: str, output_json_path: str, metadata=None):
-    with open(qa_json_path) as f:
-        qa: dict[str, list[str]] = json.load(f)
-    for q, a in zip(qa['question'], qa['answer']):
-        try:
-            response, context = rag.generate(q, [])
-        except Exception as e:
-            print(f"Error: {e}")
-            response, context = "Failed (took too long)", []
-
-        print('Question:')
-        print(q, end='\n\n')
-
-        print('Answer:')
-        print(response, end='\n\n')
-
-        print('Ground Truth:')
-        print(a, end='\n\n')
-        _context = [chunk.text + "\n\nSOURCE: " + chunk.document_name
-                    for chunk in context]
-        print("##############################################################################################")
-        append_to_output_file(output_json_path, q, response, _context, a)
-    if metadata:
-        add_metadata_to_output_json(output_json_path, metadata)
+def run_on_dataset(rag: RAG, qa_json_path: str, output_json_path: str, metadata=None,
+                   concurrency: int = 4, timeout: float | None = None):
+    run_batch(rag, qa_json_path,
+              str(Path(output_json_path).with_suffix('.jsonl')),
+              output_json_path,
+              metadata=metadata,
+              concurrency=concurrency,
+              timeout=timeout)
 
 
 def run_query(rag: RAG, query: str):
@@ -103,32 +59,32 @@ def run_query(rag: RAG, query: str):
 
 def evaluate_rag(rag_output_path: str, results_path: str,
                  truncate=False, trunc_to=4, trunc_from=0):
-    with open(rag_output_path) as f:
-        data = json.load(f)
-    if 'contexts' not in data and 'context' in data:
-        data['contexts'] = data['context']
-        del data['context']
-    if 'metadata' in data:
-        del data['metadata']
+    # ragas and datasets take seconds to import, so only evaluation pays for them
+    from datasets import Dataset
+    from ragas import evaluate as ragas_evaluate
+    from rag.evaluation import METRICS, load_rag_output
+
+    data = load_rag_output(rag_output_path)
     if truncate:
         data['question'] = data['question'][trunc_from:trunc_to]
         data['answer'] = data['answer'][trunc_from:trunc_to]
         data['contexts'] = data['contexts'][trunc_from:trunc_to]
         data['ground_truth'] = data['ground_truth'][trunc_from:trunc_to]
     dataset = Dataset.from_dict(data)
-    results = ragas_evaluate(dataset,
-                             metrics=[
-                                 answer_relevancy,
-                                 faithfulness,
-                                 context_recall,
-                                 context_precision,
-                                 answer_correctness,
-                                 answer_similarity
-                             ], raise_exceptions=False)
+    results = ragas_evaluate(dataset, metrics=METRICS, raise_exceptions=False)
     results_df = results.to_pandas()
     results_df.to_json(results_path + '.json', indent=4)
 
 
-def run_gui():
-    command = 'streamlit run gui.py'
-    os.system(command)
+def evaluate_rag_sharded(rag_output_path: str, results_path: str,
+                         shard_size: int = 8,
+                         concurrency: int = 2,
+                         requests_per_minute: float | None = None,
+                         tokens_per_minute: float | None = None) -> dict[str, float]:
+    from rag.evaluation import evaluate_sharded
+
+    return evaluate_sharded(rag_output_path, results_path,
+                            shard_size=shard_size,
+                            concurrency=concurrency,
+                            requests_per_minute=requests_per_minute,
+                            tokens_per_minute=tokens_per_minute)
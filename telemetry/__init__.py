@@ -0,0 +1,16 @@
+from telemetry.base import Hook, Span, add_hook, remove_hook, enabled, span, record, stream_timer
+from telemetry.histogram import HistogramHook
+from telemetry.otel import OpenTelemetryHook
+
+__all__ = [
+    'Hook',
+    'Span',
+    'add_hook',
+    'remove_hook',
+    'enabled',
+    'span',
+    'record',
+    'stream_timer',
+    'HistogramHook',
+    'OpenTelemetryHook',
+]
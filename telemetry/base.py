@@ -0,0 +1,128 @@
+import time
+from typing import Any
+
+
+class Hook:
+    def on_span_start(self, name: str, attributes: dict) -> Any:
+        return None
+
+    def on_span_end(self, name: str, seconds: float, attributes: dict, token: Any,
+                    error: BaseException | None = None):
+        pass
+
+    def on_value(self, name: str, value: float, attributes: dict):
+        pass
+
+
+_hooks: list[Hook] = []
+
+
+def add_hook(hook: Hook):
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def enabled() -> bool:
+    return bool(_hooks)
+
+
+class Span:
+    __slots__ = ('name', 'attributes', '_hooks', '_tokens', '_start')
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self._hooks = list(_hooks)
+        self._tokens = []
+        self._start = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._tokens = [_hook.on_span_start(self.name, self.attributes) for _hook in self._hooks]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _seconds = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        for _hook, _token in zip(self._hooks, self._tokens):
+            _hook.on_span_end(self.name, _seconds, self.attributes, _token, exc_value)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **attributes) -> Span | _NullSpan:
+    # With no hooks registered this is one list check and a shared no-op context manager
+    if not _hooks:
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def record(name: str, value: float, **attributes):
+    for _hook in _hooks:
+        _hook.on_value(name, value, attributes)
+
+
+class StreamTimer:
+    __slots__ = ('name', 'attributes', '_start', '_first', '_count')
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self._start = time.perf_counter()
+        self._first = 0.0
+        self._count = 0
+
+    def tick(self):
+        self._count += 1
+        if self._count == 1:
+            self._first = time.perf_counter()
+            record(f"{self.name}.time_to_first_token", self._first - self._start, **self.attributes)
+
+    def finish(self):
+        _seconds = time.perf_counter() - self._first
+        if self._count > 1 and _seconds > 0:
+            # Every streamed delta is counted as one token
+            record(f"{self.name}.tokens_per_second", (self._count - 1) / _seconds, **self.attributes)
+
+
+class _NullStreamTimer:
+    __slots__ = ()
+
+    def tick(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+_NULL_STREAM_TIMER = _NullStreamTimer()
+
+
+def stream_timer(name: str, **attributes) -> StreamTimer | _NullStreamTimer:
+    if not _hooks:
+        return _NULL_STREAM_TIMER
+    return StreamTimer(name, attributes)
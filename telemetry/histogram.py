@@ -0,0 +1,70 @@
+import json
+import threading
+from collections import deque
+
+import numpy as np
+
+from telemetry.base import Hook
+
+
+class HistogramHook(Hook):
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self._samples: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+        self._sums: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def on_span_end(self, name: str, seconds: float, attributes: dict, token,
+                    error: BaseException | None = None):
+        self.on_value(name, seconds, attributes)
+
+    def on_value(self, name: str, value: float, attributes: dict):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+                self._counts[name] = 0
+                self._sums[name] = 0.0
+            self._samples[name].append(value)
+            self._counts[name] += 1
+            self._sums[name] += value
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            _samples = {_name: np.fromiter(_values, dtype=np.float64)
+                        for _name, _values in self._samples.items()}
+            _counts = dict(self._counts)
+            _sums = dict(self._sums)
+        _summary = {}
+        for _name, _values in sorted(_samples.items()):
+            _p50, _p95, _p99 = np.percentile(_values, [50, 95, 99])
+            _summary[_name] = {
+                'count': _counts[_name],
+                'sum': _sums[_name],
+                'mean': float(_values.mean()),
+                'p50': float(_p50),
+                'p95': float(_p95),
+                'p99': float(_p99),
+            }
+        return _summary
+
+    def dump(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def to_prometheus(self, prefix: str = 'rag') -> str:
+        _lines = []
+        for _name, _stats in self.summary().items():
+            _metric = f"{prefix}_{_name}".replace('.', '_')
+            _lines.append(f"# TYPE {_metric} summary")
+            for _quantile in ('p50', 'p95', 'p99'):
+                _lines.append(f'{_metric}{{quantile="0.{_quantile[1:]}"}} {_stats[_quantile]}')
+            _lines.append(f"{_metric}_sum {_stats['sum']}")
+            _lines.append(f"{_metric}_count {_stats['count']}")
+        return "\n".join(_lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._sums.clear()
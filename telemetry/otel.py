@@ -0,0 +1,29 @@
+from telemetry.base import Hook
+
+
+class OpenTelemetryHook(Hook):
+    def __init__(self, tracer_name: str = 'simple-rag-pipeline'):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetryHook requires the `opentelemetry-api` package") from e
+        self._trace = trace
+        self._tracer = trace.get_tracer(tracer_name)
+
+    def on_span_start(self, name: str, attributes: dict):
+        _context = self._tracer.start_as_current_span(name, attributes=dict(attributes))
+        # The span is kept with its context manager, since the current span may differ by the time it ends
+        return _context, _context.__enter__()
+
+    def on_span_end(self, name: str, seconds: float, attributes: dict, token,
+                    error: BaseException | None = None):
+        _context, _span = token
+        _span.set_attributes(dict(attributes))
+        # Passing the exception on lets OpenTelemetry record it and mark the span as failed
+        if error is None:
+            _context.__exit__(None, None, None)
+        else:
+            _context.__exit__(type(error), error, error.__traceback__)
+
+    def on_value(self, name: str, value: float, attributes: dict):
+        self._trace.get_current_span().set_attribute(name, value)
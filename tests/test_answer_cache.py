@@ -0,0 +1,57 @@
+from llama_index.core.llms import MessageRole
+
+from benchmarks.fakes import FakeEmbedding, FakeLLM, hash_embedding
+from llm import LLM, Embedding
+from rag import RAG
+from rag.answer_cache import SemanticCache
+from vector_store import NumpyVectorStore
+
+
+EMBEDDING_SIZE = 32
+# Questions that embed identically, standing in for paraphrases a real model places close together
+PARAPHRASES = {
+    "What dose did patients receive?": "dose",
+    "Which dose were the patients given?": "dose",
+    "How long did the study last?": "duration",
+}
+
+
+class ParaphraseEmbedding(FakeEmbedding):
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return hash_embedding(PARAPHRASES.get(query, query), self.embed_dim)
+
+
+def make_rag() -> RAG:
+    return RAG(NumpyVectorStore(embedding_size=EMBEDDING_SIZE),
+               Embedding(ParaphraseEmbedding(embed_dim=EMBEDDING_SIZE)),
+               LLM(FakeLLM()),
+               answer_cache=SemanticCache())
+
+
+def ask(rag: RAG, messages: list[tuple[MessageRole, str]], prompt: str):
+    # Shaped like gui.py: the prompt is appended to the messages before they are passed as history
+    messages.append((MessageRole.USER, prompt))
+    _stream, _ = rag.generate_stream(prompt, list(messages))
+    messages.append((MessageRole.ASSISTANT, "".join(_stream)))
+
+
+def test_first_turn_paraphrase_hits_across_conversations():
+    rag = make_rag()
+    ask(rag, [], "What dose did patients receive?")
+    ask(rag, [], "Which dose were the patients given?")
+    assert rag.answer_cache.hits == 1
+
+
+def test_follow_up_hits_only_after_the_same_questions():
+    rag = make_rag()
+    _first, _second = [], []
+    ask(rag, _first, "How long did the study last?")
+    ask(rag, _first, "What dose did patients receive?")
+
+    ask(rag, _second, "How long did the study last?")
+    ask(rag, _second, "Which dose were the patients given?")
+    assert rag.answer_cache.hits == 2
+
+    # Asked first, the same question is not answered from the follow-up's partition
+    ask(rag, [], "Which dose were the patients given?")
+    assert rag.answer_cache.hits == 2
@@ -1,5 +1,9 @@
 from vector_store.neo4j import Neo4jVectorStore
+from vector_store.numpy_store import NumpyVectorStore
+from vector_store.ivf_store import IVFVectorStore
 
 __all__ = [
-    'Neo4jVectorStore'
+    'Neo4jVectorStore',
+    'NumpyVectorStore',
+    'IVFVectorStore',
 ]
@@ -1,9 +1,22 @@
+import asyncio
 from abc import ABC, abstractmethod
 
-from models import DocumentChunk
+from models import DocumentChunk, RetrievalFilter
 
 
 class VectorStore(ABC):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
     @abstractmethod
     def close(self):
         pass
@@ -13,19 +26,48 @@ class VectorStore(ABC):
         pass
 
     @abstractmethod
-    def add_batch_chunks(self, chunks: list[DocumentChunk]):
+    def add_batch_chunks(self, chunks: list[DocumentChunk]) -> float:
         pass
 
     @abstractmethod
     def retrieve(self,
                  embedding: list[float],
-                 nearest_neighbors: int = 5) -> list[tuple[DocumentChunk, float]]:
+                 nearest_neighbors: int = 5,
+                 include_embeddings: bool = False,
+                 filters: RetrievalFilter | None = None) -> list[tuple[DocumentChunk, float]]:
+        pass
+
+    def retrieve_many(self,
+                      embeddings: list[list[float]],
+                      nearest_neighbors: int = 5,
+                      include_embeddings: bool = False,
+                      filters: RetrievalFilter | None = None) -> list[list[tuple[DocumentChunk, float]]]:
+        return [self.retrieve(_embedding, nearest_neighbors, include_embeddings, filters)
+                for _embedding in embeddings]
+
+    async def aretrieve(self,
+                        embedding: list[float],
+                        nearest_neighbors: int = 5,
+                        include_embeddings: bool = False,
+                        filters: RetrievalFilter | None = None) -> list[tuple[DocumentChunk, float]]:
+        return await asyncio.to_thread(self.retrieve, embedding, nearest_neighbors, include_embeddings,
+                                       filters)
+
+    async def aclose(self):
+        self.close()
+
+    async def aclose_async_driver(self):
+        # Stores holding connections bound to the running event loop release them here
         pass
 
     @abstractmethod
     def clear_data(self):
         pass
 
+    @abstractmethod
+    def delete_document(self, document_name: str):
+        pass
+
     @abstractmethod
     def list_documents(self) -> list[str]:
         pass
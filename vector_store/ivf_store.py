@@ -0,0 +1,184 @@
+import logging
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+from vector_store.numpy_store import NumpyVectorStore
+from vector_store.quantization import Quantization
+
+
+CENTROIDS_FILE = 'centroids.npy'
+ASSIGNMENTS_FILE = 'assignments.npy'
+
+_BLOCK_SIZE = 65536
+
+
+class IVFVectorStore(NumpyVectorStore):
+    def __init__(self, path: str | Path | None = None,
+                 embedding_size=768,
+                 similarity: Literal['cosine', 'euclidean'] = 'cosine',
+                 initial_capacity=1024,
+                 n_lists=256,
+                 nprobe=8,
+                 train_size: int | None = None,
+                 max_train_points=65536,
+                 train_iterations=10,
+                 seed=0,
+                 quantization: Quantization | None = None,
+                 rescore_factor: int | None | Literal['auto'] = 'auto'):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_size = train_size if train_size is not None else 39 * n_lists
+        self.max_train_points = max_train_points
+        self.train_iterations = train_iterations
+        self.seed = seed
+        super().__init__(path, embedding_size, similarity, initial_capacity, quantization, rescore_factor)
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def train(self):
+        if self._size < self.n_lists:
+            raise ValueError(f"Need at least {self.n_lists} vectors to train, got {self._size}")
+        _rng = np.random.default_rng(self.seed)
+        _sample_ids = np.sort(_rng.choice(
+            self._size, min(self._size, self.max_train_points), replace=False))
+        _sample = self._prepare(self._vectors(_sample_ids), self._norms[_sample_ids])
+        _centroids = _sample[_rng.choice(len(_sample), self.n_lists, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            _assignments = self._nearest_centroids(_sample, _centroids)
+            _counts = np.bincount(_assignments, minlength=self.n_lists)
+            _sums = np.zeros_like(_centroids)
+            np.add.at(_sums, _assignments, _sample)
+            _empty = _counts == 0
+            _centroids[~_empty] = _sums[~_empty] / _counts[~_empty, None]
+            # Re-seed empty lists from random points so every list stays in use
+            _centroids[_empty] = _sample[_rng.choice(len(_sample), int(_empty.sum()), replace=False)]
+            if self.similarity == 'cosine':
+                _centroids /= np.maximum(np.linalg.norm(_centroids, axis=1, keepdims=True),
+                                         np.finfo(np.float32).eps)
+        self._centroids = _centroids
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._assign(0, self._size)
+        self._save_index()
+        logging.info(f"Trained IVF index with {self.n_lists} lists on {len(_sample)} vectors")
+
+    def save(self):
+        super().save()
+        self._save_index()
+
+    def _save_index(self):
+        # Assignments are only written here; lists of chunks added since are rebuilt on load
+        if self.path is None:
+            return
+        if self._centroids is None:
+            (self.path / CENTROIDS_FILE).unlink(missing_ok=True)
+            (self.path / ASSIGNMENTS_FILE).unlink(missing_ok=True)
+            return
+        self._save_array(CENTROIDS_FILE, self._centroids)
+        self._save_array(ASSIGNMENTS_FILE, self._assignments)
+
+    def _search(self, query: np.ndarray, k: int,
+                allowed: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        if self._centroids is None:
+            return super()._search(query, k, allowed)
+        return self._search_many(query[None, :], k, allowed)[0]
+
+    def _search_many(self, queries: np.ndarray, k: int,
+                     allowed: np.ndarray | None = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        _probe = min(self.nprobe, self.n_lists)
+        # A selective filter leaves fewer chunks than the probed lists would hold, so scan them exactly
+        if self._centroids is None or (allowed is not None
+                                       and len(allowed) <= self._size * _probe / self.n_lists):
+            return super()._search_many(queries, k, allowed)
+        _allowed_mask = None
+        if allowed is not None:
+            _allowed_mask = np.zeros(self._size, dtype=bool)
+            _allowed_mask[allowed] = True
+        _queries = self._prepare(queries, np.linalg.norm(queries, axis=1))
+        _centroid_scores = self._centroid_scores(_queries, self._centroids)
+        _results = []
+        for _query, _query_centroid_scores in zip(queries, _centroid_scores):
+            _lists = self._top_k(_query_centroid_scores, _probe)
+            _candidates = np.concatenate([self._list_ids(_list) for _list in _lists])
+            if _allowed_mask is not None:
+                _candidates = _candidates[_allowed_mask[_candidates]]
+                if len(_candidates) < k:
+                    _results.append(super()._search(_query, k, allowed))
+                    continue
+            if len(_candidates) == 0:
+                _results.append((_candidates, np.empty(0, dtype=np.float32)))
+                continue
+            _scores = self._scores(_query, _candidates)
+            _top = self._top_k(_scores, k)
+            _results.append((_candidates[_top], _scores[_top]))
+        return _results
+
+    def _index_added(self, start: int, end: int):
+        if self._centroids is not None:
+            self._assign(start, end)
+        elif self._size >= self.train_size:
+            self.train()
+
+    def _rewrite(self):
+        super()._rewrite()
+        self._save_index()
+
+    def _compact(self, keep: np.ndarray):
+        super()._compact(keep)
+        if self._centroids is not None:
+            self._assignments = self._assignments[keep]
+            self._invalidate_lists()
+
+    def _assign(self, start: int, end: int):
+        _assignments = [self._assignments]
+        for _block in range(start, end, _BLOCK_SIZE):
+            _block_end = min(_block + _BLOCK_SIZE, end)
+            _vectors = self._prepare(self._vectors(slice(_block, _block_end)),
+                                     self._norms[_block:_block_end])
+            _assignments.append(self._nearest_centroids(_vectors, self._centroids))
+        self._assignments = np.concatenate(_assignments).astype(np.int32)
+        self._invalidate_lists()
+
+    def _list_ids(self, list_id: int) -> np.ndarray:
+        if self._list_order is None:
+            self._list_order = np.argsort(self._assignments, kind='stable')
+            self._list_offsets = np.searchsorted(
+                self._assignments[self._list_order], np.arange(self.n_lists + 1))
+        return self._list_order[self._list_offsets[list_id]:self._list_offsets[list_id + 1]]
+
+    def _invalidate_lists(self):
+        self._list_order: np.ndarray | None = None
+        self._list_offsets: np.ndarray | None = None
+
+    def _prepare(self, vectors: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        # Cosine indexes cluster on the unit sphere, so vectors are compared by direction only
+        if self.similarity == 'cosine':
+            return vectors / np.maximum(norms, np.finfo(np.float32).eps)[:, None]
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _centroid_scores(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        _dot = vectors @ centroids.T
+        if self.similarity == 'cosine':
+            return _dot
+        return 2 * _dot - (centroids ** 2).sum(axis=1)[None, :]
+
+    def _nearest_centroids(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(self._centroid_scores(vectors, centroids), axis=1)
+
+    def _reset(self):
+        super()._reset()
+        self._centroids: np.ndarray | None = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._invalidate_lists()
+
+    def _load(self):
+        super()._load()
+        if (self.path / CENTROIDS_FILE).exists():
+            self._centroids = np.load(self.path / CENTROIDS_FILE)
+            self.n_lists = len(self._centroids)
+            self._assignments = np.load(self.path / ASSIGNMENTS_FILE)[:self._size]
+            self._assign(len(self._assignments), self._size)
+        self._invalidate_lists()
@@ -1,13 +1,48 @@
+import asyncio
+import hashlib
 import logging
-from typing import Literal
+import threading
+import time
+from typing import Callable, Literal
 
-from neo4j import GraphDatabase, ManagedTransaction
-from neo4j.graph import Node
+from neo4j import (AsyncGraphDatabase, AsyncDriver, Driver, GraphDatabase, ManagedTransaction,
+                   READ_ACCESS, Session, WRITE_ACCESS)
 
-from models import DocumentChunk
+from models import DocumentChunk, RetrievalFilter
 from vector_store.base import VectorStore
 
 
+# Drivers are shared per connection settings and reference counted, so building several stores
+# (or re-running a Streamlit script) reuses one connection pool instead of opening a new one
+_drivers: dict[tuple, Driver] = {}
+_driver_references: dict[tuple, int] = {}
+_created_indexes: set[tuple] = set()
+_lock = threading.Lock()
+
+_BATCHES_PER_ROUND = 10
+
+
+def _acquire_driver(key: tuple, **settings) -> Driver:
+    with _lock:
+        if key not in _drivers:
+            _uri, _user = key[:2]
+            logging.info(f"Opening Neo4j driver for {_uri} as {_user}")
+            _drivers[key] = GraphDatabase.driver(_uri, **settings)
+            _driver_references[key] = 0
+        _driver_references[key] += 1
+        return _drivers[key]
+
+
+def _release_driver(key: tuple):
+    with _lock:
+        _driver_references[key] -= 1
+        if _driver_references[key] > 0:
+            return
+        del _driver_references[key]
+        _drivers.pop(key).close()
+        _created_indexes.difference_update({_index for _index in _created_indexes if _index[0] == key})
+
+
 class Neo4jVectorStore(VectorStore):
     def __init__(self, uri, user, password,
                  index_name='embedding_index',
@@ -16,8 +51,37 @@ class Neo4jVectorStore(VectorStore):
                  embedding_size=768,
                  similarity: Literal['cosine', 'euclidean'] = 'cosine',
                  document_label='Document',
-                 chunk_relationship='BELONGS_TO_DOCUMENT'):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+                 chunk_relationship='BELONGS_TO_DOCUMENT',
+                 write_batch_size=1000,
+                 delete_batch_size=10000,
+                 float32_vectors=False,
+                 index_quantization: bool | None = None,
+                 database: str | None = None,
+                 driver: Driver | None = None,
+                 max_connection_pool_size=100,
+                 connection_acquisition_timeout=60.0,
+                 liveness_check_timeout: float | None = None,
+                 ensure_index=True):
+        self._pool_settings = {
+            'max_connection_pool_size': max_connection_pool_size,
+            'connection_acquisition_timeout': connection_acquisition_timeout,
+            'liveness_check_timeout': liveness_check_timeout,
+        }
+        if driver is None:
+            # Only a digest of the password goes in the key, which is kept module-wide and may be logged
+            _password = hashlib.sha256(password.encode()).hexdigest() if password is not None else None
+            self._driver_key = (uri, user, _password, *self._pool_settings.values())
+            self.driver = _acquire_driver(self._driver_key, auth=(user, password), **self._pool_settings)
+        else:
+            # Drivers passed in are owned by the caller and never closed here
+            self._driver_key = (id(driver),)
+            self.driver = driver
+        self._owns_driver = driver is None
+        self._async_driver_args = (uri, (user, password))
+        self._async_driver: AsyncDriver | None = None
+        self._async_driver_loop: asyncio.AbstractEventLoop | None = None
+        self._closed = False
+        self.database = database
         self.index_name = index_name
         self.chunk_label = chunk_label
         self.embedding_property = embedding_property
@@ -25,53 +89,184 @@ class Neo4jVectorStore(VectorStore):
         self.similarity = similarity
         self.document_label = document_label
         self.chunk_relationship = chunk_relationship
-        self.create_index()
+        self.write_batch_size = write_batch_size
+        self.delete_batch_size = delete_batch_size
+        self.float32_vectors = float32_vectors
+        self.index_quantization = index_quantization
+        if ensure_index:
+            self.create_index()
 
     def close(self):
-        self.driver.close()
+        if self._closed:
+            return
+        self._closed = True
+        if self._owns_driver:
+            _release_driver(self._driver_key)
+        else:
+            # Caller-owned drivers are keyed by id, which a later driver may reuse once this one is freed
+            with _lock:
+                _created_indexes.difference_update(
+                    {_index for _index in _created_indexes if _index[0] == self._driver_key})
+
+    async def aclose(self):
+        self.close()
+        await self.aclose_async_driver()
+
+    async def aclose_async_driver(self):
+        # Releases only the async driver; the store stays usable and builds a new one on the next async call
+        if self._async_driver is not None and self._async_driver_loop is asyncio.get_running_loop():
+            await self._async_driver.close()
+        self._async_driver = None
+        self._async_driver_loop = None
+
+    @property
+    def async_driver(self) -> AsyncDriver:
+        # The driver's connections belong to the event loop that created it, so each loop gets its own
+        _loop = asyncio.get_running_loop()
+        if self._async_driver is not None and self._async_driver_loop is not _loop:
+            logging.warning("Neo4j async driver was created on another event loop, "
+                            "call aclose_async_driver() before that loop ends; creating a new one")
+            self._async_driver = None
+        if self._async_driver is None:
+            _uri, _auth = self._async_driver_args
+            self._async_driver = AsyncGraphDatabase.driver(_uri, auth=_auth, **self._pool_settings)
+            self._async_driver_loop = _loop
+        return self._async_driver
 
     def create_index(self):
-        with self.driver.session() as session:
-            session.write_transaction(self._create_index)
-
-    def add_batch_chunks(self, chunks: list[DocumentChunk]):
-        with self.driver.session() as session:
-            _doc_chunks: dict[str, list[DocumentChunk]] = {}
-            for _chunk in chunks:
-                if _chunk.document_name not in _doc_chunks:
-                    _doc_chunks[_chunk.document_name] = []
-                _doc_chunks[_chunk.document_name].append(_chunk)
-            for _document in _doc_chunks:
-                _doc_path = _doc_chunks[_document][0].document_path
-                _doc_node = session.write_transaction(self._add_document, _document, _doc_path)
-                for _chunk in _doc_chunks[_document]:
-                    session.write_transaction(self._add_chunk_to_index, _chunk, _document)
+        _indexes = {
+            (self._driver_key, self.database, self.index_name): self._create_index,
+            (self._driver_key, self.database, f"{self.document_label}_name"): self._create_document_index,
+        }
+        with _lock:
+            _missing = {_index: _create for _index, _create in _indexes.items() if _index not in _created_indexes}
+        if not _missing:
+            logging.debug(f"Index {self.index_name} already ensured in this process")
+            return
+        with self._session() as session:
+            # Schema changes go in separate transactions, each a no-op when its index exists;
+            # one that fails is retried by the next store without redoing the other
+            for _index, _create in _missing.items():
+                if session.write_transaction(_create):
+                    with _lock:
+                        _created_indexes.add(_index)
+
+    def _session(self, access_mode: str = WRITE_ACCESS) -> Session:
+        # Read sessions may be routed to replicas when connected through a neo4j:// routing URI
+        return self.driver.session(database=self.database, default_access_mode=access_mode)
+
+    def add_batch_chunks(self, chunks: list[DocumentChunk],
+                         bulk: bool = True) -> float:
+        _start = time.perf_counter()
+        _doc_chunks: dict[str, list[DocumentChunk]] = {}
+        for _chunk in chunks:
+            if _chunk.document_name not in _doc_chunks:
+                _doc_chunks[_chunk.document_name] = []
+            _doc_chunks[_chunk.document_name].append(_chunk)
+        with self._session() as session:
+            if bulk:
+                self._add_chunks_bulk(session, _doc_chunks)
+            else:
+                for _document in _doc_chunks:
+                    _doc_path = _doc_chunks[_document][0].document_path
+                    session.write_transaction(self._add_document, _document, _doc_path)
+                    for _chunk in _doc_chunks[_document]:
+                        session.write_transaction(self._add_chunk_to_index, _chunk, _document)
+        _elapsed = time.perf_counter() - _start
+        _rate = len(chunks) / _elapsed if _elapsed > 0 else 0.0
+        logging.info(f"Added {len(chunks)} chunks in {_elapsed:.2f}s ({_rate:.1f} chunks/s)")
+        return _rate
+
+    def _add_chunks_bulk(self, session, doc_chunks: dict[str, list[DocumentChunk]]):
+        _documents = [{'name': _document, 'link': _chunks[0].document_path}
+                      for _document, _chunks in doc_chunks.items()]
+        session.write_transaction(self._add_documents, _documents)
+        _chunks = [_chunk for _document_chunks in doc_chunks.values() for _chunk in _document_chunks]
+        for _i in range(0, len(_chunks), self.write_batch_size):
+            # Embeddings are converted to plain lists one batch at a time, only for the driver
+            _rows = [{'document_name': _chunk.document_name,
+                      'text': _chunk.text,
+                      'page': _chunk.page,
+                      'embedding': _chunk.embedding_list()}
+                     for _chunk in _chunks[_i:_i + self.write_batch_size]]
+            session.write_transaction(self._add_chunks_to_index, _rows)
 
     def retrieve(self,
                  embedding: list[float],
-                 nearest_neighbors: int = 5) -> list[tuple[DocumentChunk, float]]:
-        with self.driver.session() as session:
-            _result: list[tuple[Node, Node, float]] = session.read_transaction(
-                self._find_similar_nodes, embedding, nearest_neighbors)
-            return [(DocumentChunk(
-                text=_node['text'],
-                document_name=_doc['name'],
-                document_path=_doc['link'],
-                page=_node['page'],
-                embedding=_node[self.embedding_property]
-            ), _score) for _node, _doc, _score in _result]
-
-    def clear_data(self):
-        def _delete_all(tx: ManagedTransaction):
-            tx.run("MATCH (n) DETACH DELETE n")
-
-        with self.driver.session() as session:
-            session.write_transaction(_delete_all)
+                 nearest_neighbors: int = 5,
+                 include_embeddings: bool = False,
+                 filters: RetrievalFilter | None = None) -> list[tuple[DocumentChunk, float]]:
+        with self._session(READ_ACCESS) as session:
+            _result: list[dict] = session.read_transaction(
+                self._find_similar_nodes, embedding, nearest_neighbors, include_embeddings, filters)
+            return self._to_chunks(_result)
+
+    def retrieve_many(self,
+                      embeddings: list[list[float]],
+                      nearest_neighbors: int = 5,
+                      include_embeddings: bool = False,
+                      filters: RetrievalFilter | None = None) -> list[list[tuple[DocumentChunk, float]]]:
+        if len(embeddings) == 0:
+            return []
+        with self._session(READ_ACCESS) as session:
+            _result: list[dict] = session.read_transaction(
+                self._find_similar_nodes_many, embeddings, nearest_neighbors, include_embeddings, filters)
+        _results: list[list[dict]] = [[] for _ in embeddings]
+        for _record in _result:
+            _results[_record['query_index']].append(_record)
+        return [self._to_chunks(_records) for _records in _results]
+
+    async def aretrieve(self,
+                        embedding: list[float],
+                        nearest_neighbors: int = 5,
+                        include_embeddings: bool = False,
+                        filters: RetrievalFilter | None = None) -> list[tuple[DocumentChunk, float]]:
+        async with self.async_driver.session(database=self.database,
+                                             default_access_mode=READ_ACCESS) as session:
+            _result: list[dict] = await session.execute_read(
+                self._afind_similar_nodes, embedding, nearest_neighbors, include_embeddings, filters)
+            return self._to_chunks(_result)
+
+    def clear_data(self, progress: Callable[[str, int], None] | None = None):
+        with self._session() as session:
+            self._delete_batched(session, f"MATCH (n:{self.chunk_label})", self.chunk_label, progress)
+            self._delete_batched(session, f"MATCH (n:{self.document_label})", self.document_label, progress)
+
+    def delete_document(self, document_name: str,
+                        progress: Callable[[str, int], None] | None = None):
+        with self._session() as session:
+            self._delete_batched(
+                session,
+                f"MATCH (:{self.document_label} {{name: $document_name}})"
+                f"<-[:{self.chunk_relationship}]-(n:{self.chunk_label})",
+                self.chunk_label, progress, document_name=document_name)
+            session.run(f"MATCH (d:{self.document_label} {{name: $document_name}}) DETACH DELETE d",
+                        document_name=document_name).consume()
+
+    def _delete_batched(self, session: Session, match: str, label: str,
+                        progress: Callable[[str, int], None] | None = None, **parameters):
+        # CALL { } IN TRANSACTIONS needs an auto-commit session.run; each round deletes a bounded
+        # number of nodes in small transactions so progress can be reported between rounds
+        query = (
+            f"{match} WITH n LIMIT $limit "
+            "CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF $batch_size ROWS "
+            "RETURN count(*) AS deleted"
+        )
+        _total = 0
+        while True:
+            _deleted = session.run(query, limit=self.delete_batch_size * _BATCHES_PER_ROUND,
+                                   batch_size=self.delete_batch_size, **parameters).single()['deleted']
+            if _deleted == 0:
+                break
+            _total += _deleted
+            logging.info(f"Deleted {_total} {label} nodes")
+            if progress is not None:
+                progress(label, _total)
 
     def list_documents(self) -> list[str]:
-        with self.driver.session() as session:
-            result = session.run(f"MATCH (n:{self.document_label}) RETURN n")
-            return [record['n']['name'] for record in result]
+        with self._session(READ_ACCESS) as session:
+            result = session.run(f"MATCH (n:{self.document_label}) RETURN n.name AS name")
+            return [record['name'] for record in result]
 
     def _create_index(self, tx: ManagedTransaction):
         query = (
@@ -82,29 +277,47 @@ class Neo4jVectorStore(VectorStore):
             "OPTIONS {indexConfig: {"
             f"  `vector.dimensions`: {self.embedding_size}, "
             f"  `vector.similarity_function`: '{self.similarity}' "
-            "}}"
+            + (f", `vector.quantization.enabled`: {str(self.index_quantization).lower()} "
+               if self.index_quantization is not None else "")
+            + "}}"
+        )
+        logging.info(f"Creating index: {query}")
+        try:
+            tx.run(query).consume()
+            return True
+        except Exception as e:
+            logging.error(f"Error creating index: {e}")
+            return False
+
+    def _create_document_index(self, tx: ManagedTransaction):
+        # Every bulk write row looks its document up by name; without this each lookup is a label scan
+        query = (
+            f"CREATE INDEX `{self.document_label}_name` IF NOT EXISTS "
+            f"FOR (d:{self.document_label}) ON (d.name)"
         )
         logging.info(f"Creating index: {query}")
         try:
-            tx.run(query)
+            tx.run(query).consume()
+            return True
         except Exception as e:
             logging.error(f"Error creating index: {e}")
+            return False
 
     def _add_chunk_to_index(self, tx, chunk: DocumentChunk, document_name: str):
         query = (
             f"MATCH (d:{self.document_label} {{name: $document_name}}) "
             f"CREATE (n:{self.chunk_label} {{"
             "text: $text, page: $page})"
-            f" SET n.{self.embedding_property} = $embedding "
+            f" {self._set_embedding('$embedding')} "
             f"CREATE (n)-[:{self.chunk_relationship}]->(d)"
             "RETURN n"
         )
-        logging.info(f"Adding node to index: {query}")
+        logging.debug(f"Adding node to index: {query}")
         return tx.run(
             query,
             text=chunk.text,
             page=chunk.page,
-            embedding=chunk.embedding,
+            embedding=chunk.embedding_list(),
             document_name=document_name
         ).single()[0]
 
@@ -119,18 +332,153 @@ class Neo4jVectorStore(VectorStore):
         return tx.run(
             query, name=document_name, link=document_path).single()[0]
 
+    def _add_documents(self, tx, documents: list[dict]):
+        query = (
+            "UNWIND $documents AS document "
+            f"MERGE (n:{self.document_label} {{"
+            "name: document.name, link: document.link}) "
+            "ON CREATE SET n.date = datetime()"
+        )
+        logging.info(f"Adding {len(documents)} documents to index: {query}")
+        tx.run(query, documents=documents).consume()
+
+    def _add_chunks_to_index(self, tx, rows: list[dict]):
+        query = (
+            "UNWIND $rows AS row "
+            f"MATCH (d:{self.document_label} {{name: row.document_name}}) "
+            f"CREATE (n:{self.chunk_label} {{"
+            "text: row.text, page: row.page})"
+            f" {self._set_embedding('row.embedding')} "
+            f"CREATE (n)-[:{self.chunk_relationship}]->(d)"
+        )
+        logging.debug(f"Adding {len(rows)} nodes to index: {query}")
+        tx.run(query, rows=rows).consume()
+
+    def _set_embedding(self, embedding: str) -> str:
+        if self.float32_vectors:
+            # Stored as a float32 array instead of a list of 64 bit floats, halving the property size
+            return (f"WITH * CALL db.create.setNodeVectorProperty("
+                    f"n, '{self.embedding_property}', {embedding})")
+        return f"SET n.{self.embedding_property} = {embedding}"
+
     def _find_similar_nodes(self, tx,
                             embedding: list[float],
-                            nearest_neighbors: int = 5):
-        query = (
-            f"CALL db.index.vector.queryNodes($index, $k, $vector) "
-            f"YIELD node, score "
-            f"MATCH (node)-[:{self.chunk_relationship}]->(doc) "
-            "RETURN node, doc, score "
+                            nearest_neighbors: int = 5,
+                            include_embeddings: bool = False,
+                            filters: RetrievalFilter | None = None):
+        return tx.run(self._similar_nodes_query(include_embeddings, filters),
+                      index=self.index_name, k=nearest_neighbors, vector=embedding,
+                      **self._filter_parameters(filters)).data()
+
+    def _find_similar_nodes_many(self, tx,
+                                 embeddings: list[list[float]],
+                                 nearest_neighbors: int = 5,
+                                 include_embeddings: bool = False,
+                                 filters: RetrievalFilter | None = None):
+        return tx.run(self._similar_nodes_many_query(include_embeddings, filters),
+                      index=self.index_name, k=nearest_neighbors,
+                      vectors=[list(_embedding) for _embedding in embeddings],
+                      **self._filter_parameters(filters)).data()
+
+    async def _afind_similar_nodes(self, tx,
+                                   embedding: list[float],
+                                   nearest_neighbors: int = 5,
+                                   include_embeddings: bool = False,
+                                   filters: RetrievalFilter | None = None):
+        _result = await tx.run(self._similar_nodes_query(include_embeddings, filters),
+                               index=self.index_name, k=nearest_neighbors, vector=embedding,
+                               **self._filter_parameters(filters))
+        return await _result.data()
+
+    @staticmethod
+    def _to_chunks(result: list[dict]) -> list[tuple[DocumentChunk, float]]:
+        return [(DocumentChunk(
+            text=_record['text'],
+            document_name=_record['document_name'],
+            document_path=_record['document_path'],
+            page=_record['page'],
+            embedding=_record.get('embedding', [])
+        ), _record['score']) for _record in result]
+
+    def _similar_nodes_query(self, include_embeddings: bool = False,
+                             filters: RetrievalFilter | None = None) -> str:
+        return (
+            self._search_clause('$vector', filters)
+            + f"RETURN {self._chunk_projection(include_embeddings)} "
             "ORDER BY score DESC"
         )
-        return tx.run(query, index=self.index_name, k=nearest_neighbors, vector=embedding).values()
 
+    def _similar_nodes_many_query(self, include_embeddings: bool = False,
+                                  filters: RetrievalFilter | None = None) -> str:
+        # All query vectors go out in one round trip; rows come back tagged with their query position
+        return (
+            "UNWIND range(0, size($vectors) - 1) AS query_index "
+            "CALL { "
+            "WITH query_index "
+            + self._search_clause('$vectors[query_index]', filters)
+            + f"RETURN {self._chunk_projection(include_embeddings)} "
+            "ORDER BY score DESC "
+            "} "
+            "RETURN query_index, text, page, document_name, document_path, score"
+            + (", embedding " if include_embeddings else " ")
+            + "ORDER BY query_index, score DESC"
+        )
+
+    def _search_clause(self, vector: str, filters: RetrievalFilter | None = None) -> str:
+        if filters is None:
+            return (
+                f"CALL db.index.vector.queryNodes($index, $k, {vector}) "
+                "YIELD node, score "
+                f"MATCH (node)-[:{self.chunk_relationship}]->(doc) "
+            )
+        # The vector index cannot be pre-filtered, so score the filtered candidate set directly
+        _document_conditions, _chunk_conditions = self._filter_conditions(filters)
+        return (
+            f"MATCH (doc:{self.document_label}) "
+            + (f"WHERE {' AND '.join(_document_conditions)} " if _document_conditions else "")
+            + f"MATCH (node:{self.chunk_label})-[:{self.chunk_relationship}]->(doc) "
+            + (f"WHERE {' AND '.join(_chunk_conditions)} " if _chunk_conditions else "")
+            + f"WITH node, doc, vector.similarity.{self.similarity}(node.{self.embedding_property}, {vector}) "
+            "AS score "
+            "ORDER BY score DESC LIMIT $k "
+        )
+
+    @staticmethod
+    def _filter_conditions(filters: RetrievalFilter) -> tuple[list[str], list[str]]:
+        _document_conditions = []
+        if filters.document_names is not None:
+            _document_conditions.append("doc.name IN $document_names")
+        if filters.path_prefix is not None:
+            _document_conditions.append("doc.link STARTS WITH $path_prefix")
+        if filters.ingested_after is not None:
+            _document_conditions.append("doc.date >= $ingested_after")
+        if filters.ingested_before is not None:
+            _document_conditions.append("doc.date < $ingested_before")
+        _chunk_conditions = []
+        if filters.min_page is not None:
+            _chunk_conditions.append("toIntegerOrNull(node.page) >= $min_page")
+        if filters.max_page is not None:
+            _chunk_conditions.append("toIntegerOrNull(node.page) <= $max_page")
+        return _document_conditions, _chunk_conditions
+
+    @staticmethod
+    def _filter_parameters(filters: RetrievalFilter | None) -> dict:
+        if filters is None:
+            return {}
+        return {
+            'document_names': list(filters.document_names or []),
+            'path_prefix': filters.path_prefix,
+            'min_page': filters.min_page,
+            'max_page': filters.max_page,
+            'ingested_after': filters.ingested_after,
+            'ingested_before': filters.ingested_before,
+        }
+
+    def _chunk_projection(self, include_embeddings: bool = False) -> str:
+        # Project only the fields DocumentChunk needs; vectors are large and usually unused
+        return ("node.text AS text, node.page AS page, "
+                "doc.name AS document_name, doc.link AS document_path, score"
+                + (f", node.{self.embedding_property} AS embedding" if include_embeddings else ""))
 
 # Usage example:
 # uri = "bolt://localhost:7687"
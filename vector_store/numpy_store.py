@@ -0,0 +1,434 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+from models import DocumentChunk, RetrievalFilter
+from models.retrieval_filter import page_number
+from vector_store.base import VectorStore
+from vector_store.quantization import QUANTIZERS, Quantization
+
+
+EMBEDDINGS_FILE = 'embeddings.bin'
+NORMS_FILE = 'norms.bin'
+DOCUMENT_IDS_FILE = 'document_ids.bin'
+CODES_FILE = 'codes.bin'
+SCALES_FILE = 'scales.bin'
+CHUNKS_FILE = 'chunks.jsonl'
+DOCUMENTS_FILE = 'documents.jsonl'
+METADATA_FILE = 'metadata.json'
+
+_QUERY_BLOCK_SIZE = 64
+_DEFAULT_RESCORE_FACTOR = 4
+
+
+class NumpyVectorStore(VectorStore):
+    def __init__(self, path: str | Path | None = None,
+                 embedding_size=768,
+                 similarity: Literal['cosine', 'euclidean'] = 'cosine',
+                 initial_capacity=1024,
+                 quantization: Quantization | None = None,
+                 rescore_factor: int | None | Literal['auto'] = 'auto'):
+        self.path = Path(path) if path is not None else None
+        self.embedding_size = embedding_size
+        self.similarity = similarity
+        self.initial_capacity = initial_capacity
+        self.quantization = quantization
+        # Rescoring keeps a full precision copy next to the codes. On disk it is a memory map the OS
+        # pages in on demand, in memory it would cost more than an unquantized store, so 'auto'
+        # rescores only stores with a path; pass a factor to trade that memory for recall
+        if rescore_factor == 'auto':
+            rescore_factor = _DEFAULT_RESCORE_FACTOR if self.path is not None else None
+        self.rescore_factor = rescore_factor
+        self._quantizer = QUANTIZERS[quantization] if quantization is not None else None
+        # Quantized stores only keep full precision vectors around when they are needed for rescoring
+        self._keep_full_precision = quantization is None or rescore_factor is not None
+        self._reset()
+        self.create_index()
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        self.save()
+
+    def create_index(self):
+        if self.path is None:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        if (self.path / METADATA_FILE).exists():
+            self._load()
+        else:
+            self._rewrite()
+
+    def add_batch_chunks(self, chunks: list[DocumentChunk]) -> float:
+        _start = time.perf_counter()
+        if len(chunks) > 0:
+            _embeddings = np.asarray([_chunk.embedding for _chunk in chunks], dtype=np.float32)
+            if _embeddings.ndim != 2 or _embeddings.shape[1] != self.embedding_size:
+                raise ValueError(f"Expected embeddings of size {self.embedding_size}, "
+                                 f"got {_embeddings.shape[1]}")
+            self._reserve(len(chunks))
+            _end = self._size + len(chunks)
+            if self._keep_full_precision:
+                self._embeddings[self._size:_end] = _embeddings
+            if self._quantizer is not None:
+                self._codes[self._size:_end], self._scales[self._size:_end] = \
+                    self._quantizer.encode(_embeddings)
+            self._norms[self._size:_end] = np.linalg.norm(_embeddings, axis=1)
+            _documents = len(self._documents)
+            self._document_ids[self._size:_end] = [
+                self._add_document(_chunk.document_name, _chunk.document_path) for _chunk in chunks]
+            self._texts += [_chunk.text for _chunk in chunks]
+            self._pages += [_chunk.page for _chunk in chunks]
+            self._page_numbers = None
+            self._size = _end
+            if self.path is not None:
+                self._append(chunks, self._documents[_documents:])
+            self._index_added(_end - len(chunks), _end)
+        _elapsed = time.perf_counter() - _start
+        _rate = len(chunks) / _elapsed if _elapsed > 0 else 0.0
+        logging.info(f"Added {len(chunks)} chunks in {_elapsed:.2f}s ({_rate:.1f} chunks/s)")
+        return _rate
+
+    def retrieve(self,
+                 embedding: list[float],
+                 nearest_neighbors: int = 5,
+                 include_embeddings: bool = False,
+                 filters: RetrievalFilter | None = None) -> list[tuple[DocumentChunk, float]]:
+        _allowed = self._filter_ids(filters)
+        if self._size == 0 or (_allowed is not None and len(_allowed) == 0):
+            return []
+        _query = np.asarray(embedding, dtype=np.float32)
+        _ids, _scores = self._search(_query, self._candidate_count(nearest_neighbors), _allowed)
+        if self._rescoring:
+            _ids, _scores = self._rescore(_query, _ids, nearest_neighbors)
+        return [(self._chunk(_id, include_embeddings), float(_score))
+                for _id, _score in zip(_ids, _scores)]
+
+    def retrieve_many(self,
+                      embeddings: list[list[float]],
+                      nearest_neighbors: int = 5,
+                      include_embeddings: bool = False,
+                      filters: RetrievalFilter | None = None) -> list[list[tuple[DocumentChunk, float]]]:
+        _allowed = self._filter_ids(filters)
+        if self._size == 0 or len(embeddings) == 0 or (_allowed is not None and len(_allowed) == 0):
+            return [[] for _ in embeddings]
+        _queries = np.asarray(embeddings, dtype=np.float32)
+        _results = self._search_many(_queries, self._candidate_count(nearest_neighbors), _allowed)
+        if self._rescoring:
+            _results = [self._rescore(_query, _ids, nearest_neighbors)
+                        for _query, (_ids, _) in zip(_queries, _results)]
+        return [[(self._chunk(_id, include_embeddings), float(_score))
+                 for _id, _score in zip(_ids, _scores)]
+                for _ids, _scores in _results]
+
+    def clear_data(self):
+        self._reset()
+        if self.path is not None:
+            self._rewrite()
+
+    def delete_document(self, document_name: str):
+        if document_name not in self._document_index:
+            return
+        _document_id = self._document_index[document_name]
+        self._compact(self._document_ids[:self._size] != _document_id)
+        # Not in place: arrays compacted from a read-only memory map stay read-only
+        self._document_ids = self._document_ids - (self._document_ids > _document_id).astype(np.int32)
+        del self._documents[_document_id]
+        self._document_index = {_document['name']: _i for _i, _document in enumerate(self._documents)}
+        if self.path is not None:
+            self._rewrite()
+
+    def list_documents(self) -> list[str]:
+        return [_document['name'] for _document in self._documents]
+
+    def memory_usage(self) -> dict[str, int]:
+        _search = self._norms[:self._size].nbytes
+        if self._quantizer is None:
+            _search += self._embeddings[:self._size].nbytes
+        else:
+            _search += self._codes[:self._size].nbytes + self._scales[:self._size].nbytes
+        _full_precision = self._embeddings[:self._size].nbytes if self._quantizer is not None else 0
+        return {'search_bytes': int(_search), 'rescore_bytes': int(_full_precision)}
+
+    def save(self):
+        # Inserts already reach the files; this only forces the mapped pages to disk
+        if self.path is None:
+            return
+        for _attribute in self._array_files():
+            if isinstance(_array := getattr(self, _attribute), np.memmap):
+                _array.flush()
+        self._commit()
+
+    def _search(self, query: np.ndarray, k: int,
+                allowed: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        _scores = self._scores(query, allowed)
+        _top = self._top_k(_scores, k)
+        return (_top if allowed is None else allowed[_top]), _scores[_top]
+
+    def _search_many(self, queries: np.ndarray, k: int,
+                     allowed: np.ndarray | None = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        _results = []
+        for _block in range(0, len(queries), _QUERY_BLOCK_SIZE):
+            # One matrix-matrix product per block of queries instead of one pass over the corpus each
+            _scores = self._batch_scores(queries[_block:_block + _QUERY_BLOCK_SIZE], allowed)
+            if k >= _scores.shape[1]:
+                _top = np.argsort(-_scores, axis=1)
+            else:
+                _top = np.argpartition(-_scores, k - 1, axis=1)[:, :k]
+                _top = np.take_along_axis(
+                    _top, np.argsort(-np.take_along_axis(_scores, _top, axis=1), axis=1), axis=1)
+            _results += zip(_top if allowed is None else allowed[_top],
+                            np.take_along_axis(_scores, _top, axis=1))
+        return _results
+
+    def _filter_ids(self, filters: RetrievalFilter | None) -> np.ndarray | None:
+        # Pre-filter: the search only ever scores chunks that pass the filter
+        if filters is None:
+            return None
+        _documents = [_i for _i, _document in enumerate(self._documents)
+                      if filters.matches_document(_document['name'], _document['link'], _document.get('date'))]
+        _mask = np.isin(self._document_ids[:self._size], _documents)
+        if filters.has_page_range:
+            if self._page_numbers is None:
+                self._page_numbers = np.array([_number if (_number := page_number(_page)) is not None
+                                               else np.nan for _page in self._pages], dtype=np.float64)
+            if filters.min_page is not None:
+                _mask &= self._page_numbers >= filters.min_page
+            if filters.max_page is not None:
+                _mask &= self._page_numbers <= filters.max_page
+        return np.flatnonzero(_mask)
+
+    def _index_added(self, start: int, end: int):
+        pass
+
+    def _scores(self, query: np.ndarray, ids: np.ndarray | None = None) -> np.ndarray:
+        return self._batch_scores(query[None, :], ids)[0]
+
+    def _batch_scores(self, queries: np.ndarray, ids: np.ndarray | None = None,
+                      exact: bool = False) -> np.ndarray:
+        _rows = slice(0, self._size) if ids is None else ids
+        _norms = self._norms[_rows]
+        if self._quantizer is None or exact:
+            _dot = queries @ self._embeddings[_rows].T
+        else:
+            _dot = self._quantizer.dot(self._codes[_rows], self._scales[_rows], queries)
+        _query_norms = np.linalg.norm(queries, axis=1)[:, None]
+        # Scores are normalized to [0, 1] the same way Neo4j vector indexes do
+        if self.similarity == 'cosine':
+            _cosine = _dot / np.maximum(_norms[None, :] * _query_norms, np.finfo(np.float32).eps)
+            return (1 + _cosine) / 2
+        _squared_distance = np.maximum(_norms[None, :] ** 2 - 2 * _dot + _query_norms ** 2, 0)
+        return 1 / (1 + _squared_distance)
+
+    @property
+    def _rescoring(self) -> bool:
+        return self._quantizer is not None and self.rescore_factor is not None
+
+    def _candidate_count(self, k: int) -> int:
+        return k * self.rescore_factor if self._rescoring else k
+
+    def _rescore(self, query: np.ndarray, ids: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        # Re-rank the quantized candidates with the full precision vectors, read in file order
+        _ids = np.sort(ids)
+        _scores = self._batch_scores(query[None, :], _ids, exact=True)[0]
+        _top = self._top_k(_scores, k)
+        return _ids[_top], _scores[_top]
+
+    def _vectors(self, rows: slice | np.ndarray) -> np.ndarray:
+        if self._keep_full_precision:
+            return self._embeddings[rows]
+        return self._quantizer.decode(self._codes[rows], self._scales[rows])
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        if k >= len(scores):
+            return np.argsort(-scores)
+        _ids = np.argpartition(-scores, k - 1)[:k]
+        return _ids[np.argsort(-scores[_ids])]
+
+    def _chunk(self, index: int, include_embedding: bool = False) -> DocumentChunk:
+        _document = self._documents[self._document_ids[index]]
+        return DocumentChunk(
+            text=self._texts[index],
+            document_name=_document['name'],
+            document_path=_document['link'],
+            page=self._pages[index],
+            embedding=np.array(self._vectors(slice(index, index + 1))[0]) if include_embedding else []
+        )
+
+    def _add_document(self, document_name: str, document_path: str) -> int:
+        if document_name not in self._document_index:
+            self._document_index[document_name] = len(self._documents)
+            self._documents.append({
+                'name': document_name,
+                'link': document_path,
+                'date': datetime.now(timezone.utc).isoformat(),
+            })
+        return self._document_index[document_name]
+
+    def _compact(self, keep: np.ndarray):
+        if self._keep_full_precision:
+            self._embeddings = self._embeddings[:self._size][keep]
+        if self._quantizer is not None:
+            self._codes = self._codes[:self._size][keep]
+            self._scales = self._scales[:self._size][keep]
+        self._norms = self._norms[:self._size][keep]
+        self._document_ids = self._document_ids[:self._size][keep]
+        self._texts = [_text for _text, _keep in zip(self._texts, keep) if _keep]
+        self._pages = [_page for _page, _keep in zip(self._pages, keep) if _keep]
+        self._page_numbers = None
+        self._size = len(self._norms)
+
+    def _reserve(self, count: int):
+        _capacity = len(self._norms)
+        if self._size + count <= _capacity:
+            return
+        _capacity = max(_capacity, self.initial_capacity)
+        while _capacity < self._size + count:
+            _capacity *= 2
+        if self.path is not None:
+            self._map_arrays(_capacity)
+            return
+        if self._keep_full_precision:
+            self._embeddings = self._grow(self._embeddings, _capacity)
+        if self._quantizer is not None:
+            self._codes = self._grow(self._codes, _capacity)
+            self._scales = self._grow(self._scales, _capacity)
+        self._norms = self._grow(self._norms, _capacity)
+        self._document_ids = self._grow(self._document_ids, _capacity)
+
+    def _grow(self, array: np.ndarray, capacity: int) -> np.ndarray:
+        _grown = np.empty((capacity, *array.shape[1:]), dtype=array.dtype)
+        _grown[:self._size] = array[:self._size]
+        return _grown
+
+    def _reset(self):
+        self._embeddings = np.empty((0, self.embedding_size), dtype=np.float32)
+        if self._quantizer is not None:
+            self._codes = np.empty((0, self.embedding_size), dtype=self._quantizer.dtype)
+            self._scales = np.empty(0, dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._document_ids = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._texts: list[str] = []
+        self._pages: list[str] = []
+        self._page_numbers: np.ndarray | None = None
+        self._documents: list[dict] = []
+        self._document_index: dict[str, int] = {}
+        self._log_bytes: dict[str, int] = {}
+
+    def _array_files(self) -> dict[str, str]:
+        _files = {'_norms': NORMS_FILE, '_document_ids': DOCUMENT_IDS_FILE}
+        if self._keep_full_precision:
+            _files['_embeddings'] = EMBEDDINGS_FILE
+        if self._quantizer is not None:
+            _files['_codes'] = CODES_FILE
+            _files['_scales'] = SCALES_FILE
+        return _files
+
+    def _map_arrays(self, capacity: int | None = None):
+        # Arrays are file backed and grown by extending the files, so nothing is copied into memory
+        for _attribute, _file_name in self._array_files().items():
+            _array = getattr(self, _attribute)
+            _dtype, _row_shape = _array.dtype, _array.shape[1:]
+            _row_bytes = _dtype.itemsize * int(np.prod(_row_shape))
+            _rows = capacity or (self.path / _file_name).stat().st_size // _row_bytes
+            # Drop the old mapping first, a mapped file cannot be resized on every platform
+            setattr(self, _attribute, None)
+            del _array
+            if _rows == 0:
+                setattr(self, _attribute, np.empty((0, *_row_shape), dtype=_dtype))
+                continue
+            setattr(self, _attribute, np.memmap(self.path / _file_name, dtype=_dtype, mode='r+',
+                                                shape=(_rows, *_row_shape)))
+
+    def _append(self, chunks: list[DocumentChunk], documents: list[dict]):
+        # Only the new chunks are written; metadata.json then records how much of each file is valid
+        self._log_bytes[CHUNKS_FILE] = self._append_lines(
+            CHUNKS_FILE, [{'text': _chunk.text, 'page': _chunk.page} for _chunk in chunks])
+        if documents:
+            self._log_bytes[DOCUMENTS_FILE] = self._append_lines(DOCUMENTS_FILE, documents)
+        self._commit()
+
+    def _append_lines(self, file_name: str, records: list[dict]) -> int:
+        with open(self.path / file_name, 'ab') as f:
+            f.write("".join(json.dumps(_record) + "\n" for _record in records).encode())
+            return f.tell()
+
+    def _commit(self):
+        _metadata = {
+            'embedding_size': self.embedding_size,
+            'similarity': self.similarity,
+            'quantization': self.quantization,
+            'full_precision': self._keep_full_precision,
+            'size': self._size,
+            'log_bytes': self._log_bytes,
+        }
+        _tmp_path = self.path / (METADATA_FILE + '.tmp')
+        with open(_tmp_path, 'w') as f:
+            json.dump(_metadata, f)
+        os.replace(_tmp_path, self.path / METADATA_FILE)
+
+    def _rewrite(self):
+        # Deletes and resets rewrite every file; inserts only ever append
+        for _attribute, _file_name in self._array_files().items():
+            _array = np.array(getattr(self, _attribute)[:self._size])
+            setattr(self, _attribute, _array)
+            _tmp_path = self.path / (_file_name + '.tmp')
+            _array.tofile(_tmp_path)
+            os.replace(_tmp_path, self.path / _file_name)
+        self._log_bytes = {}
+        for _file_name, _records in ((CHUNKS_FILE, [{'text': _text, 'page': _page}
+                                                    for _text, _page in zip(self._texts, self._pages)]),
+                                     (DOCUMENTS_FILE, self._documents)):
+            _tmp_path = self.path / (_file_name + '.tmp')
+            with open(_tmp_path, 'wb') as f:
+                f.write("".join(json.dumps(_record) + "\n" for _record in _records).encode())
+                self._log_bytes[_file_name] = f.tell()
+            os.replace(_tmp_path, self.path / _file_name)
+        self._commit()
+        self._map_arrays()
+
+    def _read_lines(self, file_name: str) -> list[dict]:
+        # Anything past the committed length is a partial append from an interrupted insert
+        with open(self.path / file_name, 'r+b') as f:
+            f.truncate(self._log_bytes.get(file_name, 0))
+            return [json.loads(_line) for _line in f.read().splitlines()]
+
+    def _load(self):
+        with open(self.path / METADATA_FILE) as f:
+            _metadata = json.load(f)
+        if 'size' not in _metadata:
+            raise ValueError(f"Store at {self.path} uses the old single-file layout, re-ingest it")
+        if _metadata['embedding_size'] != self.embedding_size:
+            raise ValueError(f"Store at {self.path} has embeddings of size "
+                             f"{_metadata['embedding_size']}, expected {self.embedding_size}")
+        if _metadata.get('quantization') != self.quantization:
+            raise ValueError(f"Store at {self.path} uses quantization {_metadata.get('quantization')}, "
+                             f"expected {self.quantization}")
+        if self._keep_full_precision and not _metadata.get('full_precision', True):
+            raise ValueError(f"Store at {self.path} has no full precision vectors to rescore with")
+        self.similarity = _metadata['similarity']
+        self._size = _metadata['size']
+        self._log_bytes = _metadata['log_bytes']
+        self._map_arrays()
+        _chunks = self._read_lines(CHUNKS_FILE)
+        self._texts = [_chunk['text'] for _chunk in _chunks]
+        self._pages = [_chunk['page'] for _chunk in _chunks]
+        self._page_numbers = None
+        self._documents = self._read_lines(DOCUMENTS_FILE)
+        self._document_index = {_document['name']: _i for _i, _document in enumerate(self._documents)}
+
+    def _save_array(self, file_name: str, array: np.ndarray):
+        # Write next to the target and swap it in, so live memory maps of the old file stay valid
+        _tmp_path = self.path / (file_name + '.tmp')
+        with open(_tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(_tmp_path, self.path / file_name)
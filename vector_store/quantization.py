@@ -0,0 +1,65 @@
+from abc import ABC, abstractmethod
+from typing import Literal
+
+import numpy as np
+
+
+Quantization = Literal['float16', 'int8']
+
+_BLOCK_SIZE = 4096
+
+
+class Quantizer(ABC):
+    dtype: np.dtype
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        pass
+
+    @abstractmethod
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        pass
+
+    def dot(self, codes: np.ndarray, scales: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # Decoded one block at a time so a full float32 copy of the corpus never exists
+        _dot = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for _start in range(0, len(codes), _BLOCK_SIZE):
+            _end = _start + _BLOCK_SIZE
+            _dot[:, _start:_end] = queries @ self.decode(codes[_start:_end], scales[_start:_end]).T
+        return _dot
+
+
+class Float16Quantizer(Quantizer):
+    dtype = np.dtype(np.float16)
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+
+
+class Int8Quantizer(Quantizer):
+    dtype = np.dtype(np.int8)
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Symmetric scalar quantization with one scale per vector
+        _scales = np.maximum(np.abs(vectors).max(axis=1), np.finfo(np.float32).eps) / 127
+        _codes = np.clip(np.rint(vectors / _scales[:, None]), -127, 127).astype(np.int8)
+        return _codes, _scales.astype(np.float32)
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * scales[:, None]
+
+    def dot(self, codes: np.ndarray, scales: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        _dot = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for _start in range(0, len(codes), _BLOCK_SIZE):
+            _end = _start + _BLOCK_SIZE
+            _dot[:, _start:_end] = (queries @ codes[_start:_end].astype(np.float32).T) * scales[_start:_end]
+        return _dot
+
+
+QUANTIZERS: dict[str, Quantizer] = {
+    'float16': Float16Quantizer(),
+    'int8': Int8Quantizer(),
+}